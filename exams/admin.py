@@ -1,116 +1,32 @@
 from __future__ import annotations
 from django.contrib import admin, messages
 from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
 from django.shortcuts import render, redirect
 from django.urls import path, reverse
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import (
+    FileResponse, Http404, HttpResponseForbidden, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse,
+)
 from django.template.response import TemplateResponse
+from django.utils.http import urlencode
+import json
+import tempfile
 import time
-from io import BytesIO
-from .models import Candidate, Question, Answer
-from openpyxl import load_workbook, Workbook
-from openpyxl.styles import Font, Alignment, Border, Side
-
-
-# ------------ Excel helpers ------------
-
-REQUIRED_COLS = {"army_no", "exam_type", "question", "answer"}
-KNOWN_COLS = {
-    "s_no", "name", "center", "photo", "fathers_name", "dob", "trade", "rank", "army_no", "adhaar_no",
-    # NEW:
-    "primary_qualification", "primary_duration", "primary_credits",
-    "secondary_qualification", "secondary_duration", "secondary_credits",
-    # existing:
-    "nsqf_level", "training_center", "district", "state", "viva_1", "viva_2",
-    "practical_1", "practical_2", "exam_type", "question", "answer",
-    "correct_answer", "max_marks", "part",
-}
-
-
-def _normalize_header(val: str) -> str:
-    if not val:
-        return ""
-
-    key = (val or "").strip().lower().replace(".", "_").replace(" ", "_")
-
-    mapping = {
-        "s_no": "s_no", "sno": "s_no", "s_no.": "s_no", "s_number": "s_no",
-
-        "fathers_name": "fathers_name", "father_name": "fathers_name",
-
-        "army_no": "army_no", "army_number": "army_no",
-
-        "adhaar_no": "adhaar_no", "aadhar_no": "adhaar_no",
-
-        "primary_qualification": "primary_qualification",
-    "primary qualification": "primary_qualification",
-    "primary_duration": "primary_duration",
-    "primary duration": "primary_duration",
-    "primary_credits": "primary_credits",
-    "primary credits": "primary_credits",
-
-    # Secondary
-    "secondary_qualification": "secondary_qualification",
-    "secondary qualification": "secondary_qualification",
-    "secondary_duration": "secondary_duration",
-    "secondary duration": "secondary_duration",
-    "secondary_credits": "secondary_credits",
-    "secondary credits": "secondary_credits",        "nsqf_level": "nsqf_level", "nsqf": "nsqf_level", "nsqflevel": "nsqf_level",
-
-    "training_center": "training_center", "centre_of_training": "training_center",
-
-        # ✅ Fix for your Excel
-    "center": "center",
-    "centre": "center",
-
-    "trade": "trade",
-    "trd": "trade",       # maps Excel "Tde" → model "trade"
-    }
-
-    return mapping.get(key, key)
-
-
-
-def _read_rows_from_excel(file):
-    wb = load_workbook(file, data_only=True)
-    ws = wb.worksheets[0]
-
-    headers = [_normalize_header(c.value) for c in next(ws.iter_rows(min_row=1, max_row=1, values_only=False))]
-    header_index = {h: idx for idx, h in enumerate(headers) if h}
-
-    missing = REQUIRED_COLS - set(header_index)
-    if missing:
-        raise ValueError(f"Missing required columns in Excel: {', '.join(missing)}")
-
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        data = {}
-        for key, idx in header_index.items():
-            data[key] = row[idx]
-        yield data
-
-
-def _get_or_create_question(exam_type, text, correct, max_marks, part=None):
-    if part:
-        part = str(part).strip().upper()
-    q = Question.objects.filter(exam_type=exam_type, question=text).first()
-    correct_clean = (correct or "")
-    if isinstance(correct_clean, str) and correct_clean.strip().lower() == "null":
-        correct_clean = None
-
-    if q is None:
-        q = Question.objects.create(
-            exam_type=exam_type,
-            question=text,
-            part=part,
-            correct_answer=correct_clean,
-            max_marks=max_marks or 0,
-        )
-    else:
-        q.correct_answer = correct_clean
-        q.max_marks = max_marks or 0
-        q.part = part or q.part
-        q.save()
-    return q
+from .models import Candidate, Question, Answer, ImportJob, ExportArtifact, QuestionStats, RankSnapshot
+from .exports import (
+    XLSX_CONTENT_TYPE, request_results_export, stream_results_csv, write_center_zip, write_merit_workbook,
+)
+from .importing import IMPORT_EXTENSIONS
+from .analysis import refresh_item_stats, score_distributions, OPTION_PARTS
+from .grading import (
+    CLAIM_RENEW_INTERVAL, QUEUE_FILTERS, RESPONSE_PARTS, auto_mark_candidates, claim_candidate, claim_holder,
+    load_grading_answers, marks_from_post, next_candidate_id, release_claim, response_clusters, response_questions,
+    save_marks, save_response_marks,
+)
+from .jobs import enqueue_import, enqueue_preload, fail_orphaned_jobs, job_status, export_status
+from .ranking import refresh_ranks
+from .scoring import with_percentages
 
 
 # ------------ Custom Admins ------------
@@ -125,24 +41,84 @@ class CandidateAdmin(admin.ModelAdmin):
     change_list_template = "admin/exams/candidate/change_list.html"
     change_form_template = "admin/exams/candidate/change_form.html"
     readonly_fields = ("viva_1", "viva_2", "practical_1", "practical_2")
-    list_display = ("army_no", "name", "center", "trade", "total_primary", "total_secondary", "grand_total", "is_checked")
+    list_display = ("army_no", "name", "center", "trade", "total_primary", "total_secondary", "grand_total",
+                    "primary_percentage", "secondary_percentage", "is_checked")
     list_filter = ("center", "trade", "is_checked")
     search_fields = ("army_no", "name", "rank", "fathers_name", "district", "state", "trade")
 
     # ✅ Add custom action
-    actions = ["export_filtered_results"]
+    actions = ["export_filtered_results", "export_filtered_results_csv", "export_results_by_center",
+               "auto_mark_objective_answers"]
+
+    def get_queryset(self, request):
+        # Totals and percentages come from one grouped query (conditional Sums,
+        # ExamConfig inlined), so a page costs the same few queries at any size.
+        queryset = with_percentages(super().get_queryset(request))
+        return queryset.annotate(grand_total_marks=(
+            F("primary_theory") + F("secondary_theory")
+            + Coalesce(F("viva_1"), 0) + Coalesce(F("viva_2"), 0)
+            + Coalesce(F("practical_1"), 0) + Coalesce(F("practical_2"), 0)
+        ))
+
+    # These shadow the Candidate methods of the same name, which query per row.
+    def total_primary(self, obj):
+        return obj.primary_theory
+    total_primary.short_description = "Primary Total"
+    total_primary.admin_order_field = "primary_theory"
+
+    def total_secondary(self, obj):
+        return obj.secondary_theory
+    total_secondary.short_description = "Secondary Total"
+    total_secondary.admin_order_field = "secondary_theory"
+
+    def grand_total(self, obj):
+        return obj.grand_total_marks
+    grand_total.short_description = "Grand Total"
+    grand_total.admin_order_field = "grand_total_marks"
+
+    def primary_percentage(self, obj):
+        return obj.primary_percentage
+    primary_percentage.short_description = "Primary %"
+    primary_percentage.admin_order_field = "primary_percentage"
+
+    def secondary_percentage(self, obj):
+        return obj.secondary_percentage
+    secondary_percentage.short_description = "Secondary %"
+    secondary_percentage.admin_order_field = "secondary_percentage"
 
     def get_urls(self):
         urls = super().get_urls()
         custom = [
             path("import-excel/", self.admin_site.admin_view(self.import_excel_view),
                  name="exams_candidate_import_excel"),
+            path("import-jobs/status/", self.admin_site.admin_view(self.import_job_status_view),
+                 name="exams_candidate_import_job_status"),
             path("export-results-excel/", self.admin_site.admin_view(self.export_results_excel_view),
                  name="exams_export_results_excel"),  # ✅ Added back
+            path("export-results-csv/", self.admin_site.admin_view(self.export_results_csv_view),
+                 name="exams_export_results_csv"),
+            path("export-results-by-center/", self.admin_site.admin_view(self.export_results_by_center_view),
+                 name="exams_export_results_by_center"),
+            path("export-artifacts/<int:artifact_id>/status/", self.admin_site.admin_view(self.export_status_view),
+                 name="exams_export_artifact_status"),
+            path("export-artifacts/<int:artifact_id>/download/", self.admin_site.admin_view(self.export_download_view),
+                 name="exams_export_artifact_download"),
+            path("item-analysis/", self.admin_site.admin_view(self.item_analysis_view),
+                 name="exams_item_analysis"),
+            path("grading-queue/next/", self.admin_site.admin_view(self.grading_queue_next_view),
+                 name="exams_grading_queue_next"),
+            path("grade-responses/", self.admin_site.admin_view(self.grade_responses_view),
+                 name="exams_grade_responses"),
+            path("grade-responses/<int:question_id>/", self.admin_site.admin_view(self.grade_responses_view),
+                 name="exams_grade_question_responses"),
             path("<int:candidate_id>/save-grades/", self.admin_site.admin_view(self.save_grades_view),
                  name="exams_candidate_save_grades"),
             path("<int:candidate_id>/grade-answers/", self.admin_site.admin_view(self.grade_answers_view),
                  name="exams_candidate_grade_answers"),
+            path("<int:candidate_id>/autosave-marks/", self.admin_site.admin_view(self.autosave_marks_view),
+                 name="exams_candidate_autosave_marks"),
+            path("<int:candidate_id>/claim/", self.admin_site.admin_view(self.claim_view),
+                 name="exams_candidate_claim"),
         ]
         return custom + urls
 
@@ -169,18 +145,37 @@ class CandidateAdmin(admin.ModelAdmin):
             return HttpResponseForbidden("You don't have permission to grade answers")
 
         cand = Candidate.objects.get(pk=candidate_id)
-        answers = Answer.objects.filter(candidate=cand).select_related("question")
+        # Opened from the grading queue: saving moves on to the next candidate.
+        queue = self._queue_filters(request) if "queue" in request.GET else None
+        if request.method == "POST":
+            result = self._save_posted_marks(request, cand, mark_checked=True)
+            if result["errors"] or result["conflicts"]:
+                return redirect(request.get_full_path())
+            release_claim(cand.pk, request.user)
+            if queue is not None:
+                return redirect(self._queue_next_url(queue, after=cand.pk))
+            return redirect(f"{reverse('admin:exams_candidate_change', args=[candidate_id])}?t={time.time()}")
 
-        # Auto-marking logic
-        for ans in answers:
-            cand_ans = (ans.answer or "").strip().lower()
-            corr_raw = (ans.question.correct_answer or "").strip().lower()
-            if cand_ans and corr_raw:
-                correct_list = [c.strip() for c in corr_raw.split(",")]
-                if cand_ans in correct_list:
-                    if ans.marks_obt is None or ans.marks_obt == 0:
-                        ans.marks_obt = ans.question.max_marks
-                        ans.save()
+        # Opening the page claims the candidate, so two graders don't mark the same one.
+        holder = None
+        if claim_candidate(cand.pk, request.user) is None:
+            holder = claim_holder(cand.pk)
+            if queue is not None:
+                self.message_user(
+                    request, f"{cand.army_no} is being graded by {holder[0] if holder else 'another grader'}; skipped.",
+                    level=messages.INFO,
+                )
+                return redirect(self._queue_next_url(queue, after=cand.pk))
+
+        # Read-only on GET: objective answers are marked in bulk by
+        # auto_mark_candidates (admin action, auto_mark command, or on import).
+        answers = load_grading_answers(cand.pk)
+        queue_next_url = None
+        if queue is not None:
+            next_id = next_candidate_id(after=cand.pk, user=request.user, **queue)
+            if next_id is not None:
+                enqueue_preload(next_id)
+                queue_next_url = self._queue_next_url(queue, after=cand.pk)
 
         primary_answers = [a for a in answers if a.question.exam_type.lower() == "primary"]
         secondary_answers = [a for a in answers if a.question.exam_type.lower() == "secondary"]
@@ -194,28 +189,6 @@ class CandidateAdmin(admin.ModelAdmin):
                 "Long Answer": [a for a in ans_list if norm(a.question.part) == "E"],
             }
 
-        if request.method == "POST":
-            for answer in answers:
-                field_name = f"marks_{answer.id}"
-                if field_name in request.POST:
-                    try:
-                        marks_value = request.POST[field_name].strip()
-                        if marks_value == "":
-                            answer.marks_obt = None
-                        else:
-                            new_marks = int(marks_value)
-                            if 0 <= new_marks <= answer.question.max_marks:
-                                answer.marks_obt = new_marks
-                        answer.save()
-                    except ValueError:
-                        pass
-
-            cand.is_checked = True
-            cand.save()
-
-            self.message_user(request, "Grades updated successfully", level=messages.SUCCESS)
-            return redirect(f"{reverse('admin:exams_candidate_change', args=[candidate_id])}?t={time.time()}")
-
         primary_total_obtained = sum(a.marks_obt or 0 for a in primary_answers)
         secondary_total_obtained = sum(a.marks_obt or 0 for a in secondary_answers)
 
@@ -235,282 +208,423 @@ class CandidateAdmin(admin.ModelAdmin):
             "primary_total_obtained": primary_total_obtained,
             "secondary_total_obtained": secondary_total_obtained,
             "all_marks_assigned": all_marks_assigned,
+            "queue_next_url": queue_next_url,
+            # Auto-marked from Question.answer_key; read-only on the page.
+            "objective_labels": ("MCQ", "True/False"),
+            "claim_holder": holder[0] if holder else None,
+            "claim_expires_at": holder[1] if holder else None,
+            "claim_renew_ms": CLAIM_RENEW_INTERVAL * 1000,
             "opts": self.model._meta,
         }
         return TemplateResponse(request, "admin/exams/candidate/grade_answers.html", context)
 
+    # ---------- Grading queue ----------
+    def grading_queue_next_view(self, request):
+        """
+        Send the grader to the next unchecked candidate for the chosen center,
+        trade and exam type (each optional), after ``after`` if given.
+        """
+        queue = self._queue_filters(request)
+        after = request.GET.get("after", "")
+        next_id = next_candidate_id(after=int(after) if after.isdigit() else None, user=request.user, **queue)
+        if next_id is None:
+            self.message_user(request, "No unchecked candidates left in this queue.", level=messages.INFO)
+            return redirect("admin:exams_candidate_changelist")
+        url = reverse("admin:exams_candidate_grade_answers", args=[next_id])
+        return redirect(f"{url}?{urlencode({'queue': 1, **queue})}")
+
+    def _queue_filters(self, request):
+        return {key: request.GET.get(key, "") for key in QUEUE_FILTERS}
+
+    def _queue_next_url(self, queue, after):
+        return f"{reverse('admin:exams_grading_queue_next')}?{urlencode({**queue, 'after': after})}"
+
+    def changelist_view(self, request, extra_context=None):
+        # The "Grade Next" form starts the queue with the changelist's centre/trade filters.
+        extra_context = {
+            **(extra_context or {}),
+            "queue_center": request.GET.get("center__exact", ""),
+            "queue_trade": request.GET.get("trade__exact", ""),
+        }
+        return super().changelist_view(request, extra_context)
+
+    # ---------- Autosave (AJAX) ----------
+    def autosave_marks_view(self, request, candidate_id):
+        """
+        Save one or more marks from the grading page without a reload.
+
+        Body: {"marks": {answer_id: marks}, "original": {answer_id: marks as shown}}.
+        Goes through the same save_marks() path as the full form and answers
+        with the candidate's refreshed totals.
+        """
+        if request.method != "POST":
+            return HttpResponseNotAllowed(["POST"])
+        if not request.user.has_perm('exams.change_answer'):
+            return HttpResponseForbidden("You don't have permission to grade answers")
+        try:
+            payload = json.loads(request.body or b"{}")
+            posted = {int(k): v for k, v in payload.get("marks", {}).items()}
+            original = {int(k): v for k, v in payload.get("original", {}).items()}
+        except (ValueError, TypeError, AttributeError):
+            return JsonResponse({"error": "Expected {\"marks\": {answer_id: marks}}"}, status=400)
+        if claim_candidate(candidate_id, request.user) is None:
+            return self._claimed_response(candidate_id)
+
+        result = save_marks(candidate_id, posted, original)
+        cand = Candidate.objects.filter(pk=candidate_id).only(
+            "viva_1", "viva_2", "practical_1", "practical_2",
+            "primary_theory_score", "secondary_theory_score", "total_score", "ungraded_answers",
+        ).first()
+        if cand is None:
+            raise Http404("Candidate not found")
+        current = dict(Answer.objects.filter(candidate_id=candidate_id, pk__in=list(posted))
+                       .values_list("pk", "marks_obt"))
+        return JsonResponse({
+            **result,
+            "marks": {str(pk): marks for pk, marks in current.items()},
+            "primary_total": cand.primary_theory_score + (cand.viva_1 or 0) + (cand.practical_1 or 0),
+            "secondary_total": cand.secondary_theory_score + (cand.viva_2 or 0) + (cand.practical_2 or 0),
+            "grand_total": cand.total_score,
+            "all_marks_assigned": cand.ungraded_answers == 0,
+        })
+
+    # ---------- Grader claim (AJAX) ----------
+    def claim_view(self, request, candidate_id):
+        """
+        Renew the grader's claim on a candidate (the grading page calls this
+        periodically), or give it up with ``release`` in the POST body.
+        """
+        if request.method != "POST":
+            return HttpResponseNotAllowed(["POST"])
+        if "release" in request.POST:
+            release_claim(candidate_id, request.user)
+            return JsonResponse({"claimed": False})
+        expires = claim_candidate(candidate_id, request.user)
+        if expires is None:
+            return self._claimed_response(candidate_id)
+        return JsonResponse({"claimed": True, "expires_at": expires.isoformat()})
+
+    def _claimed_response(self, candidate_id):
+        holder = claim_holder(candidate_id)
+        name = holder[0] if holder else "another grader"
+        return JsonResponse(
+            {"claimed": False, "holder": name, "error": f"Being graded by {name}; not saved."}, status=409,
+        )
+
     # ---------- Save Grades View ----------
     def save_grades_view(self, request, candidate_id):
         cand = Candidate.objects.get(pk=candidate_id)
         if request.method == "POST":
-            for ans in Answer.objects.filter(candidate=cand):
-                field_name = f"marks_{ans.id}"
-                if field_name in request.POST:
-                    try:
-                        new_marks = int(request.POST[field_name])
-                        ans.marks_obt = new_marks
-                        ans.save()
-                    except ValueError:
-                        pass
-            self.message_user(request, "Grades updated", level=messages.SUCCESS)
+            self._save_posted_marks(request, cand)
         return redirect("admin:exams_candidate_change", cand.id)
 
+    def _save_posted_marks(self, request, cand, mark_checked=False):
+        # Shared by both grading forms: validated, diff-only, one bulk write.
+        if claim_candidate(cand.pk, request.user) is None:
+            holder = claim_holder(cand.pk)
+            error = f"{cand.army_no} is being graded by {holder[0] if holder else 'another grader'}"
+            self.message_user(request, f"Not saved: {error}", level=messages.ERROR)
+            return {"changed": 0, "errors": [error], "conflicts": []}
+        posted, original = marks_from_post(request.POST)
+        result = save_marks(cand.pk, posted, original, mark_checked=mark_checked)
+        for error in result["errors"]:
+            self.message_user(request, f"Not saved: {error}", level=messages.ERROR)
+        for conflict in result["conflicts"]:
+            self.message_user(
+                request, f"Changed by another grader since you opened the page, not saved: {conflict}",
+                level=messages.WARNING,
+            )
+        self.message_user(request, f"Grades updated ({result['changed']} changed)", level=messages.SUCCESS)
+        return result
+
     # ---------- Import Excel ----------
     def import_excel_view(self, request):
-        if request.method == "POST" and request.FILES.get("excel"):
-            excel_file = request.FILES["excel"]
-            created_candidates = updated_candidates = 0
-            created_answers = updated_answers = 0
-            created_questions = 0
-
-            try:
-                with transaction.atomic():
-                    seen_questions_before = set(Question.objects.values_list("id", flat=True))
-                    for row in _read_rows_from_excel(excel_file):
-                        army = (row.get("army_no") or "").strip()
-                        if not army:
-                            continue
-
-                        cand_defaults = {
-    "s_no": row.get("s_no") or 0,
-    "name": (row.get("name") or "").strip(),
-    "center": (row.get("center") or "").strip(),  # ✅ normalize Center
-    "photo": row.get("photo") or None,
-    "fathers_name": (row.get("fathers_name") or "").strip(),
-    "dob": row.get("dob") or None,
-    "rank": (row.get("rank") or "").strip(),
-    "trade": (row.get("trade") or "").strip().upper(),    # ✅ normalize Trade
-    "adhaar_no": (row.get("adhaar_no") or "").strip(),
-    "primary_qualification": (row.get("primary_qualification") or "").strip(),
-    "primary_duration": row.get("primary_duration") or 0,
-    "primary_credits": row.get("primary_credits") or 0,
-
-    "secondary_qualification": (row.get("secondary_qualification") or "").strip(),
-    "secondary_duration": row.get("secondary_duration") or 0,
-    "secondary_credits": row.get("secondary_credits") or 0,
-    "nsqf_level": row.get("nsqf_level") or 0,
-    "training_center": (row.get("training_center") or "").strip(),
-    "district": (row.get("district") or "").strip(),
-    "state": (row.get("state") or "").strip(),
-    "viva_1": row.get("viva_1") or 0,
-    "viva_2": row.get("viva_2") or 0,
-    "practical_1": row.get("practical_1") or 0,
-    "practical_2": row.get("practical_2") or 0,
-}
-
-                        cand, created = Candidate.objects.get_or_create(
-                            army_no=army, defaults=cand_defaults
-                        )
-                        if not created:
-                            for k, v in cand_defaults.items():
-                                if v and getattr(cand, k) != v:
-                                    setattr(cand, k, v)
-                            cand.save()
-                            updated_candidates += 1
-                        else:
-                            created_candidates += 1
-
-                        q = _get_or_create_question(
-                            exam_type=row.get("exam_type") or "",
-                            text=row.get("question") or "",
-                            correct=row.get("correct_answer"),
-                            max_marks=row.get("max_marks") or 0,
-                            part=row.get("part") or None,
-                        )
-                        if q.id not in seen_questions_before:
-                            created_questions += 1
-                            seen_questions_before.add(q.id)
-
-                        ans_text = (row.get("answer") or "").strip()
-                        marks = row.get("marks_obt") or 0
-
-                        ans, a_created = Answer.objects.get_or_create(
-                            candidate=cand, question=q,
-                            defaults={"answer": ans_text, "marks_obt": int(marks)},
-                        )
-                        if a_created:
-                            created_answers += 1
-                        else:
-                            if ans.answer != ans_text or ans.marks_obt != int(marks):
-                                ans.answer = ans_text
-                                ans.marks_obt = int(marks)
-                                ans.save()
-                                updated_answers += 1
-
+        if request.method == "POST" and request.FILES.getlist("excel"):
+            uploads = request.FILES.getlist("excel")
+            bad = [f.name for f in uploads if not f.name.lower().endswith(IMPORT_EXTENSIONS)]
+            if bad:
                 self.message_user(
                     request,
-                    (
-                        f"Import complete. "
-                        f"Candidates: +{created_candidates} / updated {updated_candidates}. "
-                        f"Questions: +{created_questions}. "
-                        f"Answers: +{created_answers} / updated {updated_answers}."
-                    ),
-                    level=messages.SUCCESS,
+                    f"Unsupported file type: {', '.join(bad)} (expected {', '.join(IMPORT_EXTENSIONS)})",
+                    level=messages.ERROR,
                 )
-                return redirect("admin:exams_candidate_changelist")
-
-            except Exception as e:
-                self.message_user(request, f"Import failed: {e}", level=messages.ERROR)
-
+                return redirect("admin:exams_candidate_import_excel")
+
+            # Each upload is stored under MEDIA_ROOT/imports/ and imported by the
+            # background worker; the page then polls import_job_status_view.
+            auto_mark = bool(request.POST.get("auto_mark"))
+            # Identical re-uploads are skipped unless forced, e.g. to restore deleted data.
+            force = bool(request.POST.get("force"))
+            with transaction.atomic():
+                for excel_file in uploads:
+                    job = ImportJob.objects.create(
+                        file=excel_file, original_name=excel_file.name, created_by=request.user,
+                        auto_mark=auto_mark, force=force,
+                    )
+                    enqueue_import(job)
+
+            self.message_user(request, "Import queued. Progress is shown below.", level=messages.SUCCESS)
+            return redirect("admin:exams_candidate_import_excel")
+
+        fail_orphaned_jobs()
         ctx = {
             **self.admin_site.each_context(request),
             "opts": self.model._meta,
             "title": "Import candidates & answers from Excel",
+            "help_html": (
+                "Upload one row per answer (columns army_no, exam_type, question, answer, ...), "
+                "or one row per candidate with a column per question code plus a "
+                "<strong>Questions</strong> sheet listing code, exam_type, question, "
+                "correct_answer, max_marks and part."
+            ),
+            "jobs": [job_status(job) for job in ImportJob.objects.all()[:20]],
         }
         return render(request, "admin/exams/candidate/import_excel.html", ctx)
 
+    def import_job_status_view(self, request):
+        ids = [int(i) for i in request.GET.get("ids", "").split(",") if i.isdigit()]
+        fail_orphaned_jobs()
+        jobs = ImportJob.objects.filter(pk__in=ids).only(
+            "original_name", "status", "rows_processed", "stats", "error",
+        )
+        return JsonResponse({"jobs": [job_status(job) for job in jobs]})
+
     # ---------- Export ALL (button) ----------
     def export_results_excel_view(self, request):
         """
         Export ALL candidates (ignores filters).
         """
         queryset = Candidate.objects.all()
-        return self._generate_excel(queryset)
+        return self._generate_excel(request, queryset, "All candidates")
 
     # ---------- Export as Action (Filtered) ----------
     def export_filtered_results(self, request, queryset):
         """
         Export only currently selected or filtered candidates from the admin list.
         """
-        return self._generate_excel(queryset)
+        return self._generate_excel(request, queryset, "Filtered candidates")
 
     export_filtered_results.short_description = "Export filtered candidates to Excel"
 
+    # ---------- Export CSV (button + action) ----------
+    def export_results_csv_view(self, request):
+        """
+        Export ALL candidates' COMBINED RESULTS as CSV.
+        """
+        return self._generate_csv(Candidate.objects.all())
+
+    def export_filtered_results_csv(self, request, queryset):
+        return self._generate_csv(queryset)
+
+    export_filtered_results_csv.short_description = "Export filtered candidates to CSV"
+
+    def _generate_csv(self, queryset):
+        # Rows are streamed as they come off the chunked aggregate query, so the
+        # first byte goes out at once and memory does not grow with the cohort.
+        response = StreamingHttpResponse(stream_results_csv(queryset), content_type="text/csv")
+        response["Content-Disposition"] = 'attachment; filename="results.csv"'
+        return response
+
+    # ---------- Export per Center (ZIP) ----------
+    def export_results_by_center_view(self, request):
+        """
+        Export ALL candidates as one workbook per center, zipped.
+        """
+        return self._generate_center_zip(Candidate.objects.all())
+
+    def export_results_by_center(self, request, queryset):
+        return self._generate_center_zip(queryset)
+
+    export_results_by_center.short_description = "Export filtered candidates as a ZIP of per-center workbooks"
+
+    def _generate_center_zip(self, queryset):
+        output = tempfile.TemporaryFile()
+        write_center_zip(queryset, output)
+        output.seek(0)
+        return FileResponse(output, as_attachment=True, filename="results_by_center.zip",
+                            content_type="application/zip")
+
+    # ---------- Auto-marking ----------
+    def auto_mark_objective_answers(self, request, queryset):
+        marked = auto_mark_candidates(queryset.values_list("pk", flat=True))
+        self.message_user(request, f"Auto-marked {marked} objective answer(s).", level=messages.SUCCESS)
+
+    auto_mark_objective_answers.short_description = "Auto-mark objective answers of selected candidates"
+
+    # ---------- Item analysis ----------
+    def item_analysis_view(self, request):
+        # Only questions whose answers changed since the last visit are recomputed.
+        refresh_item_stats()
+        exam_type = request.GET.get("exam_type", "").lower()
+        stats = QuestionStats.objects.select_related("question").order_by(
+            "question__exam_type", "question__part", "difficulty",
+        )
+        if exam_type:
+            stats = stats.filter(question__exam_type=exam_type)
+
+        items = []
+        for row in stats:
+            items.append({
+                "question": row.question,
+                "responses": row.responses,
+                "mean_score": row.mean_score,
+                "difficulty": row.difficulty,
+                "discrimination": row.discrimination,
+                "options": sorted(row.option_counts.items(), key=lambda kv: -kv[1]),
+            })
+
+        ctx = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Item analysis",
+            "exam_type": exam_type,
+            "items": items,
+            "option_parts": ", ".join(OPTION_PARTS),
+            "distributions": score_distributions(),
+            "bands": [f"{low}-{low + 10}" for low in range(0, 100, 10)],
+        }
+        return TemplateResponse(request, "admin/exams/candidate/item_analysis.html", ctx)
+
+    # ---------- Grading by response ----------
+    def grade_responses_view(self, request, question_id=None):
+        """
+        Written answers grouped by normalized response: each distinct response
+        is marked once and the mark applied to every candidate who gave it.
+        """
+        exam_type = request.GET.get("exam_type", "").lower()
+        ctx = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "exam_type": exam_type,
+            "response_parts": ", ".join(RESPONSE_PARTS),
+        }
+        if question_id is None:
+            ctx.update(title="Grade by response", questions=response_questions(exam_type))
+            return TemplateResponse(request, "admin/exams/candidate/grade_responses.html", ctx)
+
+        question = Question.objects.filter(pk=question_id).first()
+        if question is None:
+            raise Http404("Question not found")
+        if request.method == "POST":
+            posted = {
+                name[len("mark_"):]: value for name, value in request.POST.items() if name.startswith("mark_")
+            }
+            result = save_response_marks(question, posted, user=request.user)
+            for error in result["errors"]:
+                messages.error(request, error)
+            if result["decided"]:
+                messages.success(
+                    request,
+                    f"Marked {result['decided']} response(s); {result['changed']} answer(s) updated.",
+                )
+            return redirect(request.get_full_path())
+
+        ctx.update(title="Grade by response", question=question, clusters=response_clusters(question))
+        return TemplateResponse(request, "admin/exams/candidate/grade_responses.html", ctx)
+
     # ---------- Helper: Generate Excel ----------
-    def _generate_excel(self, queryset):
-        wb = Workbook()
-
-        ws_primary = wb.active
-        ws_primary.title = "PRIMARY MARKS STATEMENT"
-        ws_secondary = wb.create_sheet(title="SECONDARY MARKS STATEMENT")
-        ws_combined = wb.create_sheet(title="COMBINED RESULTS")
-
-        bold_font = Font(bold=True)
-        center_aligned = Alignment(horizontal="center", vertical="center", wrap_text=True)
-        thin_border = Border(
-            left=Side(style="thin"), right=Side(style="thin"),
-            top=Side(style="thin"), bottom=Side(style="thin"),
+    def _generate_excel(self, request, queryset, description):
+        # Exports are built in the background and stored under MEDIA_ROOT/exports/,
+        # keyed by the filters and the results version; repeat clicks reuse the file.
+        artifact = request_results_export(queryset, description)
+        if artifact.status == "ready":
+            return self.export_download_view(request, artifact.pk)
+
+        ctx = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Preparing results export",
+            "artifact": export_status(artifact),
+        }
+        return TemplateResponse(request, "admin/exams/candidate/export_pending.html", ctx)
+
+    def export_status_view(self, request, artifact_id):
+        artifact = ExportArtifact.objects.filter(pk=artifact_id).only("status", "error").first()
+        if artifact is None:
+            raise Http404
+        return JsonResponse(export_status(artifact))
+
+    def export_download_view(self, request, artifact_id):
+        artifact = ExportArtifact.objects.filter(pk=artifact_id, status="ready").first()
+        if artifact is None or not artifact.file:
+            raise Http404("Export is not ready")
+        return FileResponse(
+            artifact.file.open("rb"), as_attachment=True, filename="results.xlsx",
+            content_type=XLSX_CONTENT_TYPE,
         )
 
-        # ----- Combined Sheet Formatting -----
-        ws_combined.merge_cells("A1:A2")
-        ws_combined.merge_cells("B1:B2")
-        ws_combined.merge_cells("C1:C2")
-        ws_combined.merge_cells("D1:D2")
-        ws_combined.merge_cells("E1:E2")
-        ws_combined.merge_cells("F1:F2")
-        ws_combined.merge_cells("G1:K1")
-        ws_combined.merge_cells("L1:P1")
-
-        ws_combined["A1"] = "S No"
-        ws_combined["B1"] = "Centre"
-        ws_combined["C1"] = "Army No"
-        ws_combined["D1"] = "Rk"
-        ws_combined["E1"] = "Tde"
-        ws_combined["F1"] = "Name"
-        ws_combined["G1"] = "Primary-1"
-        ws_combined["L1"] = "Secondary-1"
-
-        sub_headers = [
-            "Theory*", "Practical*", "Viva*", "Total", "Percentage (%)",
-            "Theory*", "Practical*", "Viva*", "Total", "Percentage (%)"
-        ]
-        for i, val in enumerate(sub_headers, start=7):
-            ws_combined.cell(row=2, column=i, value=val)
-
-        for row in ws_combined.iter_rows(min_row=1, max_row=2):
-            for cell in row:
-                if cell.value:
-                    cell.font = bold_font
-                    cell.alignment = center_aligned
-                    cell.border = thin_border
-
-        # ----- Headers for Primary & Secondary -----
-        primary_headers = [
-            "S No", "Name of Candidate", "Photograph", "Father's Name", "Trade", "DOB",
-            "Enrolment No", "Aadhar Number",     "Primary Qualification", "Primary Duration", 
-            "Primary Credits",
-             "NSQF Level", "Training Centre",
-            "District", "State", "Percentage"
-        ]
-        secondary_headers = [
-            "S No", "Name of Candidate", "Photograph", "Father's Name", "Trade", "DOB",
-            "Enrolment No", "Aadhar Number",     "Secondary Qualification", "Secondary Duration", 
-            "Secondary Credits",
-             "NSQF Level", "Training Centre",
-            "District", "State", "Percentage"
+
+@admin.register(RankSnapshot)
+class RankSnapshotAdmin(admin.ModelAdmin):
+    change_list_template = "admin/exams/ranksnapshot/change_list.html"
+    list_display = ("total_rank", "army_no", "candidate_name", "center", "trade", "total_score",
+                    "primary_percentage", "primary_rank", "secondary_percentage", "secondary_rank",
+                    "ungraded_answers")
+    list_display_links = None
+    list_filter = ("center", "trade")
+    list_select_related = ("candidate",)
+    search_fields = ("candidate__army_no", "candidate__name")
+    ordering = ("center", "trade", "total_rank", "candidate__army_no")
+    actions = ["export_merit_list"]
+
+    # Snapshots are derived data: readable, never edited by hand.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_actions(self, request):
+        # Snapshots are rebuilt by refresh_ranks(), not deleted by hand. Delete
+        # permission itself stays, as it cascades from Candidate.
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    def changelist_view(self, request, extra_context=None):
+        # Only partitions whose scores changed since the last visit are re-ranked.
+        refresh_ranks()
+        return super().changelist_view(request, extra_context)
+
+    def army_no(self, obj):
+        return obj.candidate.army_no
+    army_no.short_description = "Army No"
+    army_no.admin_order_field = "candidate__army_no"
+
+    def candidate_name(self, obj):
+        return obj.candidate.name
+    candidate_name.short_description = "Name"
+    candidate_name.admin_order_field = "candidate__name"
+
+    def ungraded_answers(self, obj):
+        return obj.candidate.ungraded_answers
+    ungraded_answers.short_description = "Ungraded"
+    ungraded_answers.admin_order_field = "candidate__ungraded_answers"
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom = [
+            path("export/", self.admin_site.admin_view(self.export_merit_list_view),
+                 name="exams_merit_list_export"),
         ]
+        return custom + urls
 
-        ws_primary.append(primary_headers)
-        ws_secondary.append(secondary_headers)
-
-        for row in ws_primary.iter_rows(min_row=1, max_row=1):
-            for cell in row:
-                cell.font = bold_font
-                cell.alignment = center_aligned
-                cell.border = thin_border
-
-        for row in ws_secondary.iter_rows(min_row=1, max_row=1):
-            for cell in row:
-                cell.font = bold_font
-                cell.alignment = center_aligned
-                cell.border = thin_border
-
-        # ----- Fill Candidate Data -----
-        for idx, cand in enumerate(queryset, start=1):
-            primary_theory = sum(
-                a.marks_obt or 0 for a in cand.answer_set.filter(question__exam_type__iexact="primary")
-            )
-            primary_practical = cand.practical_1 or 0
-            primary_viva = cand.viva_1 or 0
-            primary_total = primary_theory + primary_practical + primary_viva
-            primary_percentage = primary_total
+    def export_merit_list_view(self, request):
+        """
+        Export the merit list with the changelist's current filters applied.
+        """
+        refresh_ranks()
+        queryset = self.get_changelist_instance(request).get_queryset(request)
+        return self._generate_merit_excel(queryset)
 
-            secondary_theory = sum(
-                a.marks_obt or 0 for a in cand.answer_set.filter(question__exam_type__iexact="secondary")
-            )
-            secondary_practical = cand.practical_2 or 0
-            secondary_viva = cand.viva_2 or 0
-            secondary_total = secondary_theory + secondary_practical + secondary_viva
-            secondary_percentage = secondary_total
-
-            ws_combined.append([
-                idx, cand.center or "", cand.army_no or "", cand.rank or "", cand.trade or "", cand.name or "",
-                primary_theory, primary_practical, primary_viva, primary_total, primary_percentage,
-                secondary_theory, secondary_practical, secondary_viva, secondary_total, secondary_percentage
-            ])
-
-            ws_primary.append([
-                idx, cand.name or "", cand.photo or "", cand.fathers_name or "",
-                cand.trade or "", cand.dob or "", cand.army_no or "", cand.adhaar_no or "",
-                cand.primary_qualification or "", cand.primary_duration or "",
-                 cand.primary_credits or "",  cand.nsqf_level or "", cand.training_center or "",
-                cand.district or "", cand.state or "", primary_percentage
-            ])
-
-            ws_secondary.append([
-                idx, cand.name or "", cand.photo or "", cand.fathers_name or "",
-                cand.trade or "", cand.dob or "", cand.army_no or "", cand.adhaar_no or "",
-                cand.secondary_qualification or "", cand.secondary_duration or "",
-                cand.secondary_credits or "", cand.nsqf_level or "", cand.training_center or "",
-                cand.district or "", cand.state or "", secondary_percentage
-            ])
-
-        # Add borders
-        for ws in [ws_combined, ws_primary, ws_secondary]:
-            for row in ws.iter_rows(min_row=1, max_row=ws.max_row, max_col=ws.max_column):
-                for cell in row:
-                    if cell.value is not None:
-                        cell.border = thin_border
-
-        # ✅ Return Excel file
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
+    def export_merit_list(self, request, queryset):
+        return self._generate_merit_excel(queryset)
 
-        response = HttpResponse(
-            output,
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-        response["Content-Disposition"] = 'attachment; filename="results.xlsx"'
-        return response
+    export_merit_list.short_description = "Export selected ranks to Excel"
+
+    def _generate_merit_excel(self, queryset):
+        output = tempfile.TemporaryFile()
+        write_merit_workbook(queryset, output)
+        output.seek(0)
+        return FileResponse(output, as_attachment=True, filename="merit_list.xlsx",
+                            content_type=XLSX_CONTENT_TYPE)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Avg, Count, Exists, F, Max, Min, OuterRef, Q, TextField, Value
+from django.db.models.functions import Coalesce, Floor, Least, Lower, Trim
+from django.utils import timezone
+from .models import Answer, Candidate, Question, QuestionStats
+from .scoring import with_stored_percentages
+
+ITEM_STATS_BATCH = 200
+# Objective parts whose answers are single options worth counting.
+OPTION_PARTS = ("A", "B", "C", "F")
+BLANK_OPTION = "(blank)"
+# Top and bottom 27% of candidates by theory score, the usual item-analysis split.
+GROUP_FRACTION = 0.27
+# Stored candidate score that ranks candidates for each exam type.
+THEORY_SCORE_FIELDS = {
+    "primary": "primary_theory_score",
+    "secondary": "secondary_theory_score",
+}
+
+
+def mark_item_stats_stale(question_ids):
+    """Flag these questions for recomputation; one UPDATE however many answers changed."""
+    ids = {pk for pk in question_ids if pk is not None}
+    if ids:
+        QuestionStats.objects.filter(question_id__in=ids, is_stale=False).update(is_stale=True)
+
+
+def group_cutoffs(exam_type):
+    """
+    Return (bottom, top) theory-score cutoffs for ``exam_type``, or None if the
+    cohort is too small to split. Two indexed ORDER BY ... OFFSET queries.
+    """
+    field = THEORY_SCORE_FIELDS.get(exam_type)
+    if field is None:
+        return None
+    cohort = Candidate.objects.filter(
+        Exists(Answer.objects.filter(candidate=OuterRef("pk"), question__exam_type=exam_type))
+    )
+    size = cohort.count()
+    if size < 2:
+        return None
+    k = max(1, int(size * GROUP_FRACTION)) - 1
+    bottom = cohort.order_by(field).values_list(field, flat=True)[k]
+    top = cohort.order_by(f"-{field}").values_list(field, flat=True)[k]
+    if top <= bottom:
+        return None
+    return bottom, top
+
+
+def refresh_item_stats():
+    """
+    Recompute QuestionStats for stale questions (and questions never analysed).
+
+    Each batch costs two grouped queries over its answers, whatever the number
+    of answers: one for counts, means and the top/bottom group means, one for
+    option frequencies. Returns the number of questions recomputed.
+
+    Discrimination uses the group cutoffs at the time a question is computed;
+    a question's figure is only refreshed once its own answers change.
+    """
+    stale = list(
+        Question.objects.filter(Q(stats__isnull=True) | Q(stats__is_stale=True))
+        .values_list("pk", "exam_type", "max_marks", "part")
+    )
+    by_type = defaultdict(list)
+    for row in stale:
+        by_type[row[1]].append(row)
+
+    for exam_type, questions in by_type.items():
+        cutoffs = group_cutoffs(exam_type)
+        for start in range(0, len(questions), ITEM_STATS_BATCH):
+            _refresh_batch(questions[start:start + ITEM_STATS_BATCH], exam_type, cutoffs)
+    return len(stale)
+
+
+def _refresh_batch(questions, exam_type, cutoffs):
+    ids = [pk for pk, _, _, _ in questions]
+    score = Coalesce("marks_obt", 0)
+    aggregates = {"responses": Count("id"), "mean": Avg(score)}
+    if cutoffs:
+        field = f"candidate__{THEORY_SCORE_FIELDS[exam_type]}"
+        bottom, top = cutoffs
+        aggregates["top"] = Avg(score, filter=Q(**{f"{field}__gte": top}))
+        aggregates["bottom"] = Avg(score, filter=Q(**{f"{field}__lte": bottom}))
+
+    with transaction.atomic():
+        totals = {
+            row["question_id"]: row
+            for row in Answer.objects.filter(question_id__in=ids)
+            .values("question_id").annotate(**aggregates)
+        }
+        options = defaultdict(dict)
+        chosen = (
+            Answer.objects.filter(question_id__in=ids, question__part__in=OPTION_PARTS)
+            .annotate(option=Lower(Trim(Coalesce("answer", Value(""), output_field=TextField()))))
+            .values("question_id", "option").annotate(n=Count("id"))
+        )
+        for row in chosen:
+            options[row["question_id"]][row["option"] or BLANK_OPTION] = row["n"]
+
+        now = timezone.now()
+        stats = []
+        for pk, _, max_marks, part in questions:
+            row = totals.get(pk, {})
+            mean = row.get("mean") or 0
+            difficulty = discrimination = None
+            if max_marks and row.get("responses"):
+                difficulty = round(mean / max_marks, 3)
+                if row.get("top") is not None and row.get("bottom") is not None:
+                    discrimination = round((row["top"] - row["bottom"]) / max_marks, 3)
+            stats.append(QuestionStats(
+                question_id=pk, responses=row.get("responses", 0), mean_score=round(mean, 3),
+                difficulty=difficulty, discrimination=discrimination,
+                option_counts=options.get(pk, {}), is_stale=False, computed_at=now,
+            ))
+        QuestionStats.objects.bulk_create(
+            stats, update_conflicts=True, unique_fields=["question"],
+            update_fields=["responses", "mean_score", "difficulty", "discrimination",
+                           "option_counts", "is_stale", "computed_at"],
+        )
+
+
+def score_distributions(max_marks=None):
+    """
+    Per (center, trade): candidate count, mean/min/max grand total and the
+    number of candidates in each 10-point band of primary and secondary
+    percentage. Three grouped queries over the stored score columns.
+    """
+    queryset = with_stored_percentages(Candidate.objects.all(), max_marks)
+    groups = {}
+    summary = queryset.values("center", "trade").annotate(
+        candidates=Count("id"), mean=Avg("total_score"), low=Min("total_score"), high=Max("total_score"),
+    ).order_by("center", "trade")
+    for row in summary:
+        groups[(row["center"], row["trade"])] = {
+            "center": row["center"] or "", "trade": row["trade"] or "",
+            "candidates": row["candidates"], "mean": round(row["mean"] or 0, 1),
+            "low": row["low"], "high": row["high"],
+            "primary": [0] * 10, "secondary": [0] * 10,
+        }
+
+    for exam_type in THEORY_SCORE_FIELDS:
+        bands = queryset.annotate(
+            band=Least(Floor(F(f"{exam_type}_percentage") / 10), Value(9.0)),
+        ).values("center", "trade", "band").annotate(n=Count("id")).order_by()
+        for row in bands:
+            band = max(0, int(row["band"] or 0))
+            groups[(row["center"], row["trade"])][exam_type][band] += row["n"]
+    return list(groups.values())
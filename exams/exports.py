@@ -0,0 +1,342 @@
+from __future__ import annotations
+import csv
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+import django
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, Border, Side
+from .models import Candidate, ExportArtifact, ResultsVersion
+from .scoring import exam_config_max_marks, percentage_of, with_theory_totals
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXPORT_CHUNK_SIZE = 2000
+# A build still "building" after this long lost its worker (e.g. to a
+# restart) and is treated as failed.
+EXPORT_BUILD_TIMEOUT = timedelta(minutes=30)
+
+BOLD_FONT = Font(bold=True)
+CENTER_ALIGNED = Alignment(horizontal="center", vertical="center", wrap_text=True)
+THIN_BORDER = Border(
+    left=Side(style="thin"), right=Side(style="thin"),
+    top=Side(style="thin"), bottom=Side(style="thin"),
+)
+
+COMBINED_SUB_HEADERS = [
+    "Theory*", "Practical*", "Viva*", "Total", "Percentage (%)",
+    "Theory*", "Practical*", "Viva*", "Total", "Percentage (%)"
+]
+PRIMARY_HEADERS = [
+    "S No", "Name of Candidate", "Photograph", "Father's Name", "Trade", "DOB",
+    "Enrolment No", "Aadhar Number", "Primary Qualification", "Primary Duration",
+    "Primary Credits",
+    "NSQF Level", "Training Centre",
+    "District", "State", "Percentage"
+]
+SECONDARY_HEADERS = [
+    "S No", "Name of Candidate", "Photograph", "Father's Name", "Trade", "DOB",
+    "Enrolment No", "Aadhar Number", "Secondary Qualification", "Secondary Duration",
+    "Secondary Credits",
+    "NSQF Level", "Training Centre",
+    "District", "State", "Percentage"
+]
+
+
+class _Cells:
+    """Builds write-only cells for one sheet, reusing the same style objects for every cell."""
+
+    def __init__(self, ws):
+        self.ws = ws
+
+    def header(self, value):
+        cell = WriteOnlyCell(self.ws, value)
+        cell.font = BOLD_FONT
+        cell.alignment = CENTER_ALIGNED
+        cell.border = THIN_BORDER
+        return cell
+
+    def row(self, values):
+        # Same rule the old post-pass applied: border every cell that has a value.
+        out = []
+        for value in values:
+            if value is None:
+                out.append(None)
+                continue
+            cell = WriteOnlyCell(self.ws, value)
+            cell.border = THIN_BORDER
+            out.append(cell)
+        return out
+
+
+def result_rows(queryset):
+    """
+    Yield (candidate, figures) for every candidate, with theory totals from one aggregate query.
+
+    Candidates are fetched in chunks, so memory does not grow with the cohort.
+    Percentages use the ExamConfig max marks for the candidate's trade, loaded
+    once for the whole export.
+    """
+    max_marks = exam_config_max_marks()
+    for cand in with_theory_totals(queryset).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        primary_theory = cand.primary_theory
+        primary_practical = cand.practical_1 or 0
+        primary_viva = cand.viva_1 or 0
+        primary_total = primary_theory + primary_practical + primary_viva
+
+        secondary_theory = cand.secondary_theory
+        secondary_practical = cand.practical_2 or 0
+        secondary_viva = cand.viva_2 or 0
+        secondary_total = secondary_theory + secondary_practical + secondary_viva
+
+        yield cand, {
+            "primary_theory": primary_theory, "primary_practical": primary_practical,
+            "primary_viva": primary_viva, "primary_total": primary_total,
+            "primary_percentage": percentage_of(primary_total, max_marks.get((cand.trade, "primary"))),
+            "secondary_theory": secondary_theory, "secondary_practical": secondary_practical,
+            "secondary_viva": secondary_viva, "secondary_total": secondary_total,
+            "secondary_percentage": percentage_of(secondary_total, max_marks.get((cand.trade, "secondary"))),
+        }
+
+
+def write_results_workbook(queryset, output):
+    """
+    Write the three-sheet results workbook for ``queryset`` to ``output`` (path or file object).
+
+    Sheets are streamed in openpyxl's write-only mode; the layout matches the
+    old in-memory workbook cell for cell.
+    """
+    wb = Workbook(write_only=True)
+    ws_primary = wb.create_sheet(title="PRIMARY MARKS STATEMENT")
+    ws_secondary = wb.create_sheet(title="SECONDARY MARKS STATEMENT")
+    ws_combined = wb.create_sheet(title="COMBINED RESULTS")
+    primary, secondary, combined = _Cells(ws_primary), _Cells(ws_secondary), _Cells(ws_combined)
+
+    # ----- Combined Sheet Formatting -----
+    for ref in ("A1:A2", "B1:B2", "C1:C2", "D1:D2", "E1:E2", "F1:F2", "G1:K1", "L1:P1"):
+        ws_combined.merged_cells.add(ref)
+    h = combined.header
+    ws_combined.append([
+        h("S No"), h("Centre"), h("Army No"), h("Rk"), h("Tde"), h("Name"),
+        h("Primary-1"), None, None, None, None, h("Secondary-1"),
+    ])
+    ws_combined.append([None] * 6 + [h(val) for val in COMBINED_SUB_HEADERS])
+
+    # ----- Headers for Primary & Secondary -----
+    ws_primary.append([primary.header(val) for val in PRIMARY_HEADERS])
+    ws_secondary.append([secondary.header(val) for val in SECONDARY_HEADERS])
+
+    # ----- Fill Candidate Data -----
+    for idx, (cand, r) in enumerate(result_rows(queryset), start=1):
+        ws_combined.append(combined.row([
+            idx, cand.center or "", cand.army_no or "", cand.rank or "", cand.trade or "", cand.name or "",
+            r["primary_theory"], r["primary_practical"], r["primary_viva"], r["primary_total"], r["primary_percentage"],
+            r["secondary_theory"], r["secondary_practical"], r["secondary_viva"], r["secondary_total"],
+            r["secondary_percentage"],
+        ]))
+
+        ws_primary.append(primary.row([
+            idx, cand.name or "", cand.photo or "", cand.fathers_name or "",
+            cand.trade or "", cand.dob or "", cand.army_no or "", cand.adhaar_no or "",
+            cand.primary_qualification or "", cand.primary_duration or "",
+            cand.primary_credits or "", cand.nsqf_level or "", cand.training_center or "",
+            cand.district or "", cand.state or "", r["primary_percentage"],
+        ]))
+
+        ws_secondary.append(secondary.row([
+            idx, cand.name or "", cand.photo or "", cand.fathers_name or "",
+            cand.trade or "", cand.dob or "", cand.army_no or "", cand.adhaar_no or "",
+            cand.secondary_qualification or "", cand.secondary_duration or "",
+            cand.secondary_credits or "", cand.nsqf_level or "", cand.training_center or "",
+            cand.district or "", cand.state or "", r["secondary_percentage"],
+        ]))
+
+    wb.save(output)
+
+
+# ------------ CSV export ------------
+
+COMBINED_CSV_HEADERS = [
+    "S No", "Centre", "Army No", "Rk", "Tde", "Name",
+    "Primary Theory", "Primary Practical", "Primary Viva", "Primary Total", "Primary Percentage (%)",
+    "Secondary Theory", "Secondary Practical", "Secondary Viva", "Secondary Total", "Secondary Percentage (%)",
+]
+
+
+class _Echo:
+    """csv.writer target that hands each formatted line straight back."""
+
+    def write(self, value):
+        return value
+
+
+def stream_results_csv(queryset):
+    """Yield the COMBINED RESULTS columns as CSV lines, one candidate at a time."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COMBINED_CSV_HEADERS)
+    for idx, (cand, r) in enumerate(result_rows(queryset), start=1):
+        yield writer.writerow([
+            idx, cand.center or "", cand.army_no or "", cand.rank or "", cand.trade or "", cand.name or "",
+            r["primary_theory"], r["primary_practical"], r["primary_viva"], r["primary_total"], r["primary_percentage"],
+            r["secondary_theory"], r["secondary_practical"], r["secondary_viva"], r["secondary_total"],
+            r["secondary_percentage"],
+        ])
+
+
+# ------------ Merit list export ------------
+
+MERIT_HEADERS = [
+    "Centre", "Tde", "Merit Rank", "Army No", "Rk", "Name", "Grand Total",
+    "Primary Percentage (%)", "Primary Rank", "Secondary Percentage (%)", "Secondary Rank",
+    "Ungraded Answers",
+]
+
+
+def write_merit_workbook(queryset, output):
+    """Write RankSnapshot rows, one line per candidate in merit order within each centre and trade."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("MERIT LIST")
+    cells = _Cells(ws)
+    ws.append([cells.header(h) for h in MERIT_HEADERS])
+
+    rows = (
+        queryset.select_related("candidate")
+        .order_by("center", "trade", "total_rank", "candidate__army_no")
+    )
+    for snap in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        cand = snap.candidate
+        ws.append(cells.row([
+            snap.center, snap.trade, snap.total_rank, cand.army_no or "", cand.rank or "", cand.name or "",
+            snap.total_score, snap.primary_percentage, snap.primary_rank,
+            snap.secondary_percentage, snap.secondary_rank, cand.ungraded_answers,
+        ]))
+    wb.save(output)
+
+
+# ------------ Per-center ZIP export ------------
+
+def _build_center_workbook(center, query):
+    # Runs in a worker process with its own database connection. It receives
+    # the pickled Query, not a QuerySet: pickling a QuerySet evaluates it.
+    queryset = Candidate.objects.all()
+    queryset.query = query
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    with os.fdopen(fd, "wb") as fh:
+        write_results_workbook(queryset, fh)
+    return center, path
+
+
+def _center_filename(center):
+    name = re.sub(r"[^A-Za-z0-9 _.-]+", "_", center or "").strip() or "No centre"
+    return f"{name}.xlsx"
+
+
+def _center_is(center):
+    return Q(center=center) if center else Q(center="") | Q(center__isnull=True)
+
+
+def write_center_zip(queryset, output, workers=None):
+    """
+    Write one three-sheet results workbook per center into a ZIP at ``output``.
+
+    Each center's workbook is built in its own process, so the whole export
+    takes about as long as the largest center.
+    """
+    # NULL and "" are one "No centre" group, as in ranking._candidates_in.
+    centers = list(
+        queryset.annotate(center_key=Coalesce("center", Value("")))
+        .order_by("center_key").values_list("center_key", flat=True).distinct()
+    )
+    if not centers:
+        with zipfile.ZipFile(output, "w"):
+            return
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(centers)))
+    # spawn rather than fork: the web server may be running threads.
+    ctx = multiprocessing.get_context("spawn")
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as zf, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=django.setup) as pool:
+        futures = [
+            pool.submit(_build_center_workbook, center, queryset.filter(_center_is(center)).query)
+            for center in centers
+        ]
+        for future in as_completed(futures):
+            center, path = future.result()
+            try:
+                zf.write(path, _center_filename(center))
+            finally:
+                os.remove(path)
+
+
+# ------------ Cached export artifacts ------------
+
+def queryset_signature(queryset):
+    """Stable hash of the SQL (filters and ordering) behind a candidate queryset."""
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        sql, params = "EMPTY", ()
+    return hashlib.sha256(f"{sql}|{params!r}".encode("utf-8")).hexdigest()
+
+
+def _stuck_builds():
+    cutoff = timezone.now() - EXPORT_BUILD_TIMEOUT
+    return Q(status="building") & (Q(started_at__lt=cutoff) | Q(started_at__isnull=True))
+
+
+def prune_stale_exports(keep=None):
+    """
+    Delete artifacts (and their files) built from older data, whatever their
+    filters: they can never be served again. Builds still in progress are
+    left to finish unless they are stuck; ``keep`` spares one artifact that
+    a user may still be polling.
+    """
+    stale = ExportArtifact.objects.filter(data_version__lt=ResultsVersion.current()).filter(
+        ~Q(status="building") | _stuck_builds()
+    )
+    if keep is not None:
+        stale = stale.exclude(pk=keep)
+    for old in stale:
+        old.file.delete(save=False)
+    stale.delete()
+
+
+def request_results_export(queryset, description=""):
+    """
+    Return the ExportArtifact for ``queryset`` at the current data version.
+
+    A ready artifact is served as is. Otherwise one build is queued, even when
+    many users ask at once; get_or_create on the unique key collapses them.
+    A failed build, or one stuck past EXPORT_BUILD_TIMEOUT, is queued again.
+    """
+    from .jobs import enqueue_export
+
+    filter_hash = queryset_signature(queryset)
+    version = ResultsVersion.current()
+    key = hashlib.sha256(f"{filter_hash}:{version}".encode("utf-8")).hexdigest()
+    now = timezone.now()
+
+    artifact, created = ExportArtifact.objects.get_or_create(
+        key=key,
+        defaults={
+            "filter_hash": filter_hash, "data_version": version,
+            "description": description[:255], "started_at": now,
+        },
+    )
+    if not created and artifact.status != "ready":
+        # Retry, but only from the one request that wins the reset.
+        retry = ExportArtifact.objects.filter(pk=artifact.pk).filter(Q(status="failed") | _stuck_builds())
+        created = bool(retry.update(status="building", error=None, started_at=now))
+        artifact.status = "building"
+    if created:
+        enqueue_export(artifact, queryset)
+    return artifact
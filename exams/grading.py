@@ -0,0 +1,418 @@
+from __future__ import annotations
+from django.core.cache import cache
+from django.db import transaction
+from collections import defaultdict
+from datetime import timedelta
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .analysis import OPTION_PARTS, mark_item_stats_stale
+from .models import Answer, Candidate, Question, ResponseMark, ResultsVersion, normalize_answer, normalize_response
+from .ranking import mark_ranks_stale
+from .scoring import refresh_scores
+
+AUTO_MARK_BATCH = 500
+AUTO_MARK_WRITE_BATCH = 1000
+# Preloaded grading pages are kept this long (seconds) for the grader to arrive.
+GRADING_PRELOAD_TIMEOUT = 600
+QUEUE_FILTERS = ("center", "trade", "exam_type")
+# Written-answer parts graded response by response rather than candidate by candidate.
+RESPONSE_PARTS = ("D",)
+# A grader's claim on a candidate lapses after CLAIM_LEASE seconds; the
+# grading page renews it every CLAIM_RENEW_INTERVAL seconds while open.
+CLAIM_LEASE = 300
+CLAIM_RENEW_INTERVAL = 60
+
+
+def stale_auto_marks(queryset=None):
+    """Answers auto-marked from an answer key that has been edited since."""
+    queryset = Answer.objects.all() if queryset is None else queryset
+    return queryset.filter(key_version__isnull=False).exclude(key_version=F("question__answer_key_version"))
+
+
+def auto_mark_candidates(candidate_ids):
+    """
+    Auto-mark the objective answers of ``candidate_ids`` against Question.answer_key.
+
+    An unmarked answer (NULL or 0) that is in its question's key gets full
+    marks. An earlier auto-mark whose key has since changed is re-checked:
+    re-marked if it still matches, reset to 0 if it no longer does. Marks
+    entered by a grader (key_version NULL, non-zero) are never touched.
+
+    Each batch of candidates is one answer query, one question query for keys
+    not seen yet and one bulk_update. Returns the number of answers changed.
+    """
+    ids = sorted({pk for pk in candidate_ids if pk is not None})
+    keys = {}
+    marked = 0
+    for start in range(0, len(ids), AUTO_MARK_BATCH):
+        batch = ids[start:start + AUTO_MARK_BATCH]
+        unmarked = Q(marks_obt__isnull=True) | Q(marks_obt=0)
+        answers = list(
+            Answer.objects.filter(candidate_id__in=batch)
+            .filter(unmarked | Q(key_version__isnull=False))
+            .only("id", "candidate_id", "question_id", "answer", "marks_obt", "key_version")
+        )
+        missing = {a.question_id for a in answers} - keys.keys()
+        if missing:
+            for pk, key, version, max_marks in Question.objects.filter(pk__in=missing).values_list(
+                "pk", "answer_key", "answer_key_version", "max_marks",
+            ):
+                keys[pk] = (frozenset(key), version, max_marks)
+
+        to_update = []
+        for ans in answers:
+            accepted, version, max_marks = keys[ans.question_id]
+            if ans.key_version == version:
+                continue
+            if max_marks and normalize_answer(ans.answer) in accepted:
+                ans.marks_obt, ans.key_version = max_marks, version
+            elif ans.key_version is not None:
+                # Auto-marked from an older key that no longer accepts this answer.
+                ans.marks_obt, ans.key_version = 0, None
+            else:
+                continue
+            to_update.append(ans)
+        if not to_update:
+            continue
+
+        with transaction.atomic():
+            Answer.objects.bulk_update(to_update, ["marks_obt", "key_version"], batch_size=AUTO_MARK_WRITE_BATCH)
+            # bulk_update skips the signals.
+            mark_ranks_stale(refresh_scores({a.candidate_id for a in to_update}))
+            mark_item_stats_stale({a.question_id for a in to_update})
+        marked += len(to_update)
+
+    if marked:
+        ResultsVersion.bump()
+    return marked
+
+
+def marks_from_post(data):
+    """
+    Split grading form data into ({answer_id: posted marks}, {answer_id: marks as rendered}).
+
+    Inputs are named ``marks_<id>``; the optional hidden ``orig_<id>`` carries
+    the value the page was rendered with, for lost-update detection.
+    """
+    posted, original = {}, {}
+    for name, value in data.items():
+        prefix, _, pk = name.partition("_")
+        if pk.isdigit() and prefix in ("marks", "orig"):
+            (posted if prefix == "marks" else original)[int(pk)] = value
+    return posted, original
+
+
+def _parse_marks(raw):
+    raw = "" if raw is None else str(raw).strip()
+    return None if raw == "" else int(raw)
+
+
+def _same(a, b):
+    # The grading page shows unmarked (NULL) answers as 0.
+    return (a or 0) == (b or 0)
+
+
+def save_marks(candidate_id, posted, original=None, mark_checked=False):
+    """
+    The one write path for grader-entered marks.
+
+    ``posted`` maps answer id to the submitted value, ``original`` (optional)
+    to the value the grader's page showed. Values are validated against the
+    question's max_marks, and only answers whose marks actually change are
+    written, with one bulk_update in a short transaction.
+
+    When ``original`` is given, an answer someone else changed after the page
+    was loaded is not overwritten: if this grader changed it too, it is
+    reported as a conflict; if not, the other grader's value stands.
+    ``mark_checked`` marks the candidate checked, unless anything was rejected.
+    Answers to objective parts (OPTION_PARTS) are marked from the answer key
+    by auto_mark_candidates only, and are ignored here.
+
+    Returns {"changed": n, "errors": [...], "conflicts": [...]}.
+    """
+    original = original or {}
+    result = {"changed": 0, "errors": [], "conflicts": []}
+    with transaction.atomic():
+        answers = (
+            Answer.objects.select_for_update()
+            .filter(candidate_id=candidate_id, pk__in=list(posted))
+            .select_related("question")
+            .only("id", "candidate_id", "question_id", "marks_obt", "key_version",
+                  "question__question", "question__max_marks", "question__part")
+        )
+        changed = []
+        for ans in answers:
+            if (ans.question.part or "").strip().upper() in OPTION_PARTS:
+                continue
+            label = (ans.question.question or "")[:50]
+            try:
+                new = _parse_marks(posted[ans.pk])
+            except ValueError:
+                result["errors"].append(f"{label}: {posted[ans.pk]!r} is not a number")
+                continue
+            if new is not None and not 0 <= new <= ans.question.max_marks:
+                result["errors"].append(f"{label}: {new} is outside 0-{ans.question.max_marks}")
+                continue
+
+            if ans.pk in original:
+                try:
+                    seen = _parse_marks(original[ans.pk])
+                except ValueError:
+                    seen = ans.marks_obt
+                if _same(new, seen):
+                    continue  # this grader left it alone
+                if not _same(ans.marks_obt, seen) and not _same(ans.marks_obt, new):
+                    result["conflicts"].append(
+                        f"{label}: now {ans.marks_obt or 0} (you entered {new or 0}, page showed {seen or 0})"
+                    )
+                    continue
+            if _same(new, ans.marks_obt):
+                continue
+            ans.marks_obt = new
+            ans.key_version = None  # entered by a grader, not the answer key
+            changed.append(ans)
+
+        if changed:
+            Answer.objects.bulk_update(changed, ["marks_obt", "key_version"])
+            mark_ranks_stale(refresh_scores([candidate_id]))
+            mark_item_stats_stale({a.question_id for a in changed})
+        if mark_checked and not result["errors"] and not result["conflicts"]:
+            # A rejected value sends the grader back to fix it; keep the
+            # candidate in the queue until the marks are in.
+            Candidate.objects.filter(pk=candidate_id, is_checked=False).update(is_checked=True)
+    if changed:
+        ResultsVersion.bump()
+    result["changed"] = len(changed)
+    return result
+
+
+# ------------ Response clusters ------------
+
+def response_questions(exam_type=None):
+    """Written-answer questions with their answer, distinct-response and unmarked counts."""
+    questions = Question.objects.filter(part__in=RESPONSE_PARTS)
+    if exam_type:
+        questions = questions.filter(exam_type=exam_type.lower())
+    return questions.annotate(
+        answers=Count("answer"),
+        responses=Count("answer__response_hash", distinct=True),
+        unmarked=Count("answer", filter=Q(answer__marks_obt__isnull=True) | Q(answer__marks_obt=0)),
+    ).order_by("exam_type", "pk")
+
+
+def response_clusters(question):
+    """
+    The distinct responses to ``question``, most common first: one grouped
+    query over its answers plus one for the decisions already made.
+    """
+    rows = (
+        Answer.objects.filter(question=question).values("response_hash")
+        .annotate(
+            answers=Count("id"),
+            unmarked=Count("id", filter=Q(marks_obt__isnull=True) | Q(marks_obt=0)),
+            sample=Min("answer"),
+            low=Min(Coalesce("marks_obt", 0)),
+            high=Max(Coalesce("marks_obt", 0)),
+        )
+        .order_by("-answers", "response_hash")
+    )
+    decided = dict(ResponseMark.objects.filter(question=question).values_list("answer_hash", "marks"))
+    return [
+        dict(row, text=normalize_response(row["sample"]), decided=decided.get(row["response_hash"]))
+        for row in rows
+    ]
+
+
+def save_response_marks(question, posted, user=None):
+    """
+    Record a grader's marks for distinct responses to ``question`` and apply
+    each to every matching answer.
+
+    ``posted`` maps response hash to the submitted value; blanks and values
+    equal to the decision already on record are skipped. Decisions are
+    upserted into ResponseMark, and matching answers are rewritten with one
+    UPDATE per distinct mark, however many candidates gave the response.
+    Returns {"changed": answers updated, "decided": n, "errors": [...]}.
+    """
+    result = {"changed": 0, "decided": 0, "errors": []}
+    texts = dict(
+        Answer.objects.filter(question=question, response_hash__in=list(posted))
+        .values("response_hash").annotate(sample=Min("answer")).values_list("response_hash", "sample")
+    )
+    decided = dict(ResponseMark.objects.filter(question=question).values_list("answer_hash", "marks"))
+    by_marks = defaultdict(list)
+    for answer_hash, raw in posted.items():
+        if answer_hash not in texts:
+            continue
+        label = normalize_response(texts[answer_hash])[:50] or "(blank)"
+        try:
+            marks = _parse_marks(raw)
+        except ValueError:
+            result["errors"].append(f"{label}: {raw!r} is not a number")
+            continue
+        if marks is None or marks == decided.get(answer_hash):
+            continue
+        if not 0 <= marks <= question.max_marks:
+            result["errors"].append(f"{label}: {marks} is outside 0-{question.max_marks}")
+            continue
+        by_marks[marks].append(answer_hash)
+    if not by_marks:
+        return result
+
+    now = timezone.now()
+    with transaction.atomic():
+        ResponseMark.objects.bulk_create(
+            [
+                ResponseMark(question=question, answer_hash=h, answer_text=normalize_response(texts[h]),
+                             marks=marks, decided_by=user, decided_at=now)
+                for marks, hashes in by_marks.items() for h in hashes
+            ],
+            update_conflicts=True, unique_fields=["question", "answer_hash"],
+            update_fields=["answer_text", "marks", "decided_by", "decided_at"],
+        )
+        candidate_ids = set()
+        for marks, hashes in by_marks.items():
+            matching = Answer.objects.filter(question=question, response_hash__in=hashes).exclude(marks_obt=marks)
+            candidate_ids.update(matching.values_list("candidate_id", flat=True))
+            result["changed"] += matching.update(marks_obt=marks, key_version=None)
+        if result["changed"]:
+            # QuerySet.update() skips the signals.
+            mark_ranks_stale(refresh_scores(candidate_ids))
+            mark_item_stats_stale([question.pk])
+    if result["changed"]:
+        ResultsVersion.bump()
+    result["decided"] = sum(len(hashes) for hashes in by_marks.values())
+    return result
+
+
+def apply_response_marks(candidate_ids):
+    """
+    Give the unmarked answers (NULL or 0) of ``candidate_ids`` the marks a
+    grader already decided for the same response, one UPDATE per batch.
+
+    Used by the importer, which refreshes the stored scores afterwards.
+    Returns the number of answers marked.
+    """
+    ids = sorted({pk for pk in candidate_ids if pk is not None})
+    decision = ResponseMark.objects.filter(
+        question=OuterRef("question"), answer_hash=OuterRef("response_hash"),
+    ).exclude(marks=0)
+    marked = 0
+    for start in range(0, len(ids), AUTO_MARK_BATCH):
+        marked += (
+            Answer.objects.filter(candidate_id__in=ids[start:start + AUTO_MARK_BATCH])
+            .filter(Q(marks_obt__isnull=True) | Q(marks_obt=0))
+            .filter(Exists(decision))
+            .update(marks_obt=Subquery(decision.values("marks")[:1]), key_version=None)
+        )
+    return marked
+
+
+# ------------ Grader claims ------------
+
+def _claimable(user=None):
+    # Unclaimed, lapsed, or already held by ``user``.
+    free = Q(claim_expires_at__isnull=True) | Q(claim_expires_at__lte=timezone.now())
+    return free | Q(claimed_by=user) if user is not None else free
+
+
+def claim_candidate(candidate_id, user):
+    """
+    Claim a candidate for ``user``, or renew the claim ``user`` already holds.
+
+    One conditional single-row UPDATE, so of two graders opening the same
+    candidate only one wins. Returns the new expiry, or None while another
+    grader's claim is live.
+    """
+    expires = timezone.now() + timedelta(seconds=CLAIM_LEASE)
+    claimed = Candidate.objects.filter(_claimable(user), pk=candidate_id).update(
+        claimed_by=user, claim_expires_at=expires,
+    )
+    return expires if claimed else None
+
+
+def release_claim(candidate_id, user):
+    """Give up ``user``'s claim on the candidate, if they still hold it."""
+    Candidate.objects.filter(pk=candidate_id, claimed_by=user).update(claimed_by=None, claim_expires_at=None)
+
+
+def claim_holder(candidate_id):
+    """(username, expiry) of the live claim on the candidate, or None."""
+    return (
+        Candidate.objects.filter(pk=candidate_id, claim_expires_at__gt=timezone.now())
+        .values_list("claimed_by__username", "claim_expires_at").first()
+    )
+
+
+# ------------ Grading queue ------------
+
+def grading_queue(center=None, trade=None, exam_type=None, user=None):
+    """
+    Unchecked candidates in queue order; filtered and ordered along
+    cand_grading_queue_idx. With ``user``, candidates claimed by other
+    graders are left out.
+    """
+    queue = Candidate.objects.filter(is_checked=False)
+    if user is not None:
+        queue = queue.filter(_claimable(user))
+    if center:
+        queue = queue.filter(center=center)
+    if trade:
+        queue = queue.filter(trade=trade)
+    if exam_type:
+        queue = queue.filter(Exists(
+            Answer.objects.filter(candidate=OuterRef("pk"), question__exam_type=exam_type.lower())
+        ))
+    return queue.order_by("pk")
+
+
+def next_candidate_id(after=None, user=None, **filters):
+    """
+    The next unchecked candidate after ``after``, wrapping round to the start
+    of the queue; with ``user``, skipping candidates other graders hold.
+    """
+    queue = grading_queue(user=user, **filters).values_list("pk", flat=True)
+    if after is not None:
+        following = queue.filter(pk__gt=after).first()
+        if following is not None:
+            return following
+        queue = queue.exclude(pk=after)
+    return queue.first()
+
+
+def _grading_cache_key(candidate_id):
+    return f"exams:grading:{candidate_id}"
+
+
+def preload_grading_answers(candidate_id):
+    """Load a candidate's answers and questions ahead of time, for load_grading_answers()."""
+    answers = list(Answer.objects.filter(candidate_id=candidate_id).select_related("question").order_by("pk"))
+    cache.set(_grading_cache_key(candidate_id), answers, GRADING_PRELOAD_TIMEOUT)
+
+
+def load_grading_answers(candidate_id):
+    """
+    The candidate's answers with their questions, for the grading page.
+
+    Uses the preloaded copy when there is one. Question and answer texts
+    come from the preload, but marks are always re-read (one narrow query),
+    so another grader's saves are never shown stale.
+    """
+    key = _grading_cache_key(candidate_id)
+    answers = cache.get(key)
+    if answers is None:
+        return list(Answer.objects.filter(candidate_id=candidate_id).select_related("question").order_by("pk"))
+    cache.delete(key)
+
+    fresh = {
+        pk: (marks, version)
+        for pk, marks, version in Answer.objects.filter(candidate_id=candidate_id)
+        .values_list("pk", "marks_obt", "key_version")
+    }
+    if fresh.keys() != {a.pk for a in answers}:
+        # Answers were added or removed since the preload.
+        return list(Answer.objects.filter(candidate_id=candidate_id).select_related("question").order_by("pk"))
+    for ans in answers:
+        ans.marks_obt, ans.key_version = fresh[ans.pk]
+    return answers
@@ -0,0 +1,866 @@
+from __future__ import annotations
+import csv
+import hashlib
+import io
+import os
+import re
+from datetime import date, datetime
+from itertools import islice
+from dateutil import parser as date_parser
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from openpyxl import load_workbook
+from .models import Candidate, Question, Answer, ImportedFile, ResultsVersion, question_hash, response_hash
+from .analysis import mark_item_stats_stale
+from .grading import apply_response_marks, auto_mark_candidates
+from .ranking import mark_ranks_stale
+from .scoring import refresh_scores
+
+
+# ------------ Excel helpers ------------
+
+REQUIRED_COLS = {"army_no", "exam_type", "question", "answer"}
+KNOWN_COLS = {
+    "s_no", "name", "center", "photo", "fathers_name", "dob", "trade", "rank", "army_no", "adhaar_no",
+    # NEW:
+    "primary_qualification", "primary_duration", "primary_credits",
+    "secondary_qualification", "secondary_duration", "secondary_credits",
+    # existing:
+    "nsqf_level", "training_center", "district", "state", "viva_1", "viva_2",
+    "practical_1", "practical_2", "exam_type", "question", "answer",
+    "correct_answer", "max_marks", "part",
+}
+
+
+def _normalize_header(val: str) -> str:
+    if not val:
+        return ""
+
+    key = str(val).strip().lower().replace(".", "_").replace(" ", "_")
+
+    mapping = {
+        "s_no": "s_no", "sno": "s_no", "s_no.": "s_no", "s_number": "s_no",
+
+        "fathers_name": "fathers_name", "father_name": "fathers_name",
+
+        "army_no": "army_no", "army_number": "army_no",
+
+        "adhaar_no": "adhaar_no", "aadhar_no": "adhaar_no",
+
+        "primary_qualification": "primary_qualification",
+    "primary qualification": "primary_qualification",
+    "primary_duration": "primary_duration",
+    "primary duration": "primary_duration",
+    "primary_credits": "primary_credits",
+    "primary credits": "primary_credits",
+
+    # Secondary
+    "secondary_qualification": "secondary_qualification",
+    "secondary qualification": "secondary_qualification",
+    "secondary_duration": "secondary_duration",
+    "secondary duration": "secondary_duration",
+    "secondary_credits": "secondary_credits",
+    "secondary credits": "secondary_credits",        "nsqf_level": "nsqf_level", "nsqf": "nsqf_level", "nsqflevel": "nsqf_level",
+
+    "training_center": "training_center", "centre_of_training": "training_center",
+
+        # ✅ Fix for your Excel
+    "center": "center",
+    "centre": "center",
+
+    "trade": "trade",
+    "trd": "trade",       # maps Excel "Tde" → model "trade"
+    }
+
+    return mapping.get(key, key)
+
+
+
+class SheetRow(dict):
+    """A parsed row that remembers where in the file it came from, for error messages."""
+
+    def __init__(self, values, sheet=None, line=None):
+        super().__init__(values)
+        self.sheet = sheet
+        self.line = line
+
+    @property
+    def location(self):
+        return f"{self.sheet} row {self.line}" if self.sheet else f"Row {self.line}"
+
+
+def _header_index(header_row):
+    headers = [_normalize_header(v) for v in header_row]
+    header_index = {h: idx for idx, h in enumerate(headers) if h}
+
+    missing = REQUIRED_COLS - set(header_index)
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    return header_index
+
+
+# Wide layout: one row per candidate with one column per question code, and
+# the question text/key/marks on a separate "Questions" sheet.
+QUESTION_SHEET_NAMES = {"questions", "question_bank"}
+QUESTION_CODE_COLS = {"code", "question_code", "q_code", "q_no", "qno", "question_no"}
+QUESTION_SHEET_COLS = ("exam_type", "question", "correct_answer", "max_marks", "part")
+
+
+def _read_question_sheet(ws):
+    rows = ws.iter_rows(values_only=True)
+    headers = [_normalize_header(v) for v in next(rows, ())]
+    index = {("code" if h in QUESTION_CODE_COLS else h): idx for idx, h in enumerate(headers) if h}
+
+    missing = {"code", "exam_type", "question"} - set(index)
+    if missing:
+        raise ValueError(f"Missing required columns in {ws.title} sheet: {', '.join(sorted(missing))}")
+
+    questions = {}
+    for line, row in enumerate(rows, start=2):
+        width = len(row)
+        code = _normalize_header(row[index["code"]]) if index["code"] < width else ""
+        if code:
+            questions[code] = SheetRow({
+                key: (row[index[key]] if key in index and index[key] < width else None)
+                for key in QUESTION_SHEET_COLS
+            }, ws.title, line)
+    return questions
+
+
+def _code_shape(code):
+    # "q12" and "q4" share the shape "q#"; used to spot mistyped code columns.
+    return re.sub(r"\d+", "#", code)
+
+
+def _long_rows(header_row, rows, sheet=None):
+    header_index = _header_index(header_row)
+    # Read-only worksheets yield blank rows too, so this is the sheet's own numbering.
+    for line, row in enumerate(rows, start=2):
+        # Read-only rows stop at the last filled cell, so pad short ones.
+        width = len(row)
+        yield SheetRow({key: (row[idx] if idx < width else None) for key, idx in header_index.items()}, sheet, line)
+
+
+def _wide_rows(header_row, rows, questions, sheet=None):
+    """
+    Expand one-row-per-candidate rows into the usual one-row-per-answer dicts,
+    each carrying the sheet row it came from.
+    """
+    headers = [_normalize_header(v) for v in header_row]
+    question_cols = [(idx, questions[h]) for idx, h in enumerate(headers) if h in questions]
+    cand_cols = {h: idx for idx, h in enumerate(headers) if h and h not in questions}
+    if "army_no" not in cand_cols:
+        raise ValueError("Missing required columns: army_no")
+    if not question_cols:
+        raise ValueError("No column matches a code on the Questions sheet")
+    # Other unknown columns are ignored, as in the long layout, but one shaped
+    # like a question code is a typo whose answers would otherwise be lost.
+    shapes = {_code_shape(code) for code in questions}
+    unknown = [
+        str(header_row[idx]).strip() for h, idx in cand_cols.items()
+        if h not in KNOWN_COLS and _code_shape(h) in shapes
+    ]
+    if unknown:
+        raise ValueError(
+            f"{sheet or 'Data'} sheet: column(s) {', '.join(unknown)} match no code on the Questions sheet"
+        )
+
+    for line, row in enumerate(rows, start=2):
+        width = len(row)
+        base = {key: (row[idx] if idx < width else None) for key, idx in cand_cols.items()}
+        for idx, question in question_cols:
+            answer = SheetRow({**base, **question, "answer": row[idx] if idx < width else None}, sheet, line)
+            # Question fields are validated against their Questions-sheet row.
+            answer.question_row = question
+            yield answer
+
+
+def _read_rows_from_excel(file, all_sheets=False):
+    """
+    Stream the first worksheet as dicts keyed by normalized header.
+
+    The workbook is opened read-only and rows come back as plain value tuples,
+    so memory stays flat however many rows the sheet has. With ``all_sheets``
+    every worksheet that carries the required columns is read in turn and the
+    others (cover or instruction sheets) are skipped.
+
+    A workbook with a "Questions" sheet is read in the wide layout: data
+    sheets without a question column are expanded to one dict per answer.
+    """
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        question_ws = next((ws for ws in wb.worksheets if ws.title.strip().lower() in QUESTION_SHEET_NAMES), None)
+        questions = _read_question_sheet(question_ws) if question_ws is not None else None
+        data_sheets = [ws for ws in wb.worksheets if ws is not question_ws]
+        worksheets = data_sheets if all_sheets else data_sheets[:1]
+
+        matched = False
+        for ws in worksheets:
+            rows = ws.iter_rows(values_only=True)
+            header_row = next(rows, ())
+            wide = questions is not None and "question" not in {_normalize_header(v) for v in header_row}
+            try:
+                sheet_rows = (
+                    _wide_rows(header_row, rows, questions, ws.title) if wide
+                    else _long_rows(header_row, rows, ws.title)
+                )
+                first = next(sheet_rows, None)
+            except ValueError:
+                # Cover or instruction sheets are skipped; a wide data sheet with bad columns is not.
+                if all_sheets and not (wide and "army_no" in {_normalize_header(v) for v in header_row}):
+                    continue
+                raise
+            matched = True
+
+            if first is not None:
+                yield first
+                yield from sheet_rows
+
+        if not matched:
+            raise ValueError(f"No worksheet has the required columns: {', '.join(sorted(REQUIRED_COLS))}")
+    finally:
+        wb.close()
+
+
+# ------------ CSV / TSV helpers ------------
+
+IMPORT_EXTENSIONS = (".xlsx", ".csv", ".tsv")
+
+# Columns openpyxl hands back as numbers; CSV cells are coerced to match.
+NUMERIC_COLS = {
+    "s_no", "primary_duration", "primary_credits", "secondary_duration", "secondary_credits",
+    "nsqf_level", "viva_1", "viva_2", "practical_1", "practical_2", "max_marks", "marks_obt",
+}
+DATE_COLS = {"dob"}
+
+
+def _coerce_number(val):
+    try:
+        num = float(val)
+    except ValueError:
+        return val  # left for validation to report
+    return int(num) if num.is_integer() else num
+
+
+def _coerce_date(val):
+    # Excel date cells come back as datetimes, so CSV dates do too.
+    try:
+        return datetime.fromisoformat(val)
+    except ValueError:
+        pass
+    try:
+        return date_parser.parse(val, dayfirst=True)
+    except (ValueError, OverflowError):
+        return val
+
+
+def _coerce_csv_value(key, val):
+    val = val.strip()
+    if val == "":
+        return None
+    if key in NUMERIC_COLS:
+        return _coerce_number(val)
+    if key in DATE_COLS:
+        return _coerce_date(val)
+    return val
+
+
+def _read_rows_from_csv(file, delimiter=","):
+    """
+    Stream a CSV/TSV file as the same dicts _read_rows_from_excel yields.
+
+    ``file`` may be a path or a binary file object such as an upload.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        fh = open(file, "rb")
+        close = True
+    else:
+        fh, close = file, False
+    text = io.TextIOWrapper(fh, encoding="utf-8-sig", newline="")
+    try:
+        rows = csv.reader(text, delimiter=delimiter)
+        header_index = _header_index(next(rows, ()))
+
+        end = rows.line_num
+        for row in rows:
+            # line_num counts physical lines, so quoted newlines and skipped
+            # blank lines keep the numbering in step with the file.
+            line, end = end + 1, rows.line_num
+            if not any(row):
+                continue
+            width = len(row)
+            yield SheetRow({
+                key: (_coerce_csv_value(key, row[idx]) if idx < width else None)
+                for key, idx in header_index.items()
+            }, line=line)
+    finally:
+        # Don't let the wrapper close an upload the caller still owns.
+        text.detach()
+        if close:
+            fh.close()
+
+
+def read_rows(file, name=None, all_sheets=False):
+    """Dispatch to the CSV, TSV or Excel reader based on the file name."""
+    name = (name or getattr(file, "name", None) or str(file)).lower()
+    if name.endswith(".csv"):
+        return _read_rows_from_csv(file, delimiter=",")
+    if name.endswith(".tsv"):
+        return _read_rows_from_csv(file, delimiter="\t")
+    if name.endswith(".xlsx"):
+        return _read_rows_from_excel(file, all_sheets=all_sheets)
+    raise ValueError(f"Unsupported file type: {os.path.basename(name)} (expected {', '.join(IMPORT_EXTENSIONS)})")
+
+
+# ------------ Pre-flight validation ------------
+
+MAX_REPORTED_ERRORS = 200
+VALID_CENTERS = {value for value, _ in Candidate.CENTER_CHOICES}
+VALID_TRADES = {value for value, _ in Candidate.TRADE_CHOICES}
+VALID_EXAM_TYPES = {value for value, _ in Question.EXAM_TYPES}
+VALID_PARTS = {value for value, _ in Question.PART_CHOICES}
+NON_NEGATIVE_COLS = {"primary_duration", "primary_credits", "secondary_duration", "secondary_credits"}
+INTEGER_COLS = NUMERIC_COLS - {"nsqf_level"}
+
+
+class ImportValidationError(ValueError):
+    def __init__(self, errors, total):
+        self.errors = errors
+        self.total = total
+        lines = errors + ([f"... and {total - len(errors)} more"] if total > len(errors) else [])
+        super().__init__(f"{total} problem(s) found, nothing was imported:\n" + "\n".join(lines))
+
+    def __reduce__(self):
+        # Raised inside import_answer's worker processes, so it must pickle.
+        return type(self), (self.errors, self.total)
+
+
+def _check_number(val, integer):
+    if val is None or val == "":
+        return True
+    if isinstance(val, bool):
+        return False
+    if isinstance(val, (int, float)):
+        return not integer or float(val).is_integer()
+    try:
+        num = float(str(val).strip())
+    except ValueError:
+        return False
+    return not integer or num.is_integer()
+
+
+def _check_date(val):
+    if val is None or val == "" or isinstance(val, (date, datetime)):
+        return True
+    try:
+        date.fromisoformat(str(val).strip()[:10])
+    except ValueError:
+        return False
+    return True
+
+
+def _unwritable(row):
+    """
+    Yield (column, value) for each value the import could not store, by
+    running the writer's own conversions (_candidate_defaults,
+    _question_values, _to_python, _marks_obt) over the row.
+    """
+    for model, values in ((Candidate, _candidate_defaults(row)), (Question, _question_values(row))):
+        for key, val in values.items():
+            try:
+                model._meta.get_field(key).to_python(val)
+            except ValidationError:
+                yield key, row.get(key)
+    try:
+        _marks_obt(row)
+    except (TypeError, ValueError):
+        yield "marks_obt", row.get("marks_obt")
+
+
+def _problem(col):
+    if col in DATE_COLS:
+        return "is not a date"
+    if col in NUMERIC_COLS:
+        return f"must be a {'whole ' if col in INTEGER_COLS else ''}number"
+    return "has a value that cannot be stored"
+
+
+def validate_rows(rows):
+    """
+    Check parsed rows without touching the database and return every problem found.
+
+    Covers column types, dob, exam type and part, centers and trades against the
+    model choices, and repeated (army_no, question) pairs. Every value is also
+    put through the writer's conversions (_unwritable), so a file that passes
+    cannot fail half-way through the import. Problems are given
+    by sheet and line (SheetRow.location) and reported once per location, so
+    a wide-layout row expanded into many answers is not repeated. Only the
+    first MAX_REPORTED_ERRORS messages are kept; the second value is the
+    full count.
+    """
+    errors = []
+    total = 0
+    seen = {}
+    reported = set()
+
+    def report(msg):
+        nonlocal total
+        if msg in reported:
+            return
+        reported.add(msg)
+        total += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(msg)
+
+    try:
+        for n, row in enumerate(rows, start=2):
+            where = getattr(row, "location", None) or f"Row {n}"
+            # Wide layout: question fields come from the Questions sheet and are
+            # reported against that row, once, not once per candidate.
+            source = getattr(row, "question_row", None)
+            q_where = source.location if source is not None else where
+            army = _text(row.get("army_no"))
+            if not army:
+                continue
+
+            flagged = set()
+            for col in NUMERIC_COLS & row.keys():
+                val = row[col]
+                at = q_where if col in QUESTION_SHEET_COLS else where
+                if not _check_number(val, integer=col in INTEGER_COLS):
+                    flagged.add(col)
+                    report(f"{at}: {col} {_problem(col)}, got {val!r}")
+                elif col in NON_NEGATIVE_COLS and val not in (None, "") and float(val) < 0:
+                    report(f"{at}: {col} cannot be negative, got {val!r}")
+            if not _check_date(row.get("dob")):
+                flagged.add("dob")
+                report(f"{where}: dob {_problem('dob')}, got {row['dob']!r}")
+            for col, val in _unwritable(row):
+                if col not in flagged:
+                    at = q_where if col in QUESTION_SHEET_COLS else where
+                    report(f"{at}: {col} {_problem(col)}, got {val!r}")
+
+            center = _text(row.get("center"))
+            if center and center not in VALID_CENTERS:
+                report(f"{where}: unknown center {center!r}")
+            trade = _text(row.get("trade")).upper()
+            if trade and trade not in VALID_TRADES:
+                report(f"{where}: unknown trade {trade!r}")
+            exam_type = _text(row.get("exam_type")).lower()
+            if exam_type not in VALID_EXAM_TYPES:
+                report(f"{q_where}: exam_type must be one of {', '.join(sorted(VALID_EXAM_TYPES))}, got {exam_type!r}")
+            part = _text(row.get("part")).upper()
+            if part and part not in VALID_PARTS:
+                report(f"{q_where}: unknown part {part!r}")
+            text = row.get("question")
+            if not _text(text):
+                report(f"{q_where}: question is empty")
+                continue
+
+            key = (army, exam_type, question_hash(text))
+            if key in seen:
+                report(f"{where}: duplicate answer for {army} to the same question as {seen[key]}")
+            else:
+                seen[key] = where
+    except ValueError as e:
+        # Header problems (missing required columns) surface from the reader.
+        report(str(e))
+
+    return errors, total
+
+
+def check_rows(rows):
+    errors, total = validate_rows(rows)
+    if total:
+        raise ImportValidationError(errors, total)
+
+
+# ------------ Bulk import engine ------------
+
+# Rows are diffed and written one chunk at a time, so memory stays bounded by
+# the chunk rather than the workbook. Writes go out in BATCH_SIZE statements.
+IMPORT_CHUNK_ROWS = 5000
+IMPORT_BATCH_SIZE = 500
+# Keeps IN (...) lookups under SQLite's bound-parameter limit.
+LOOKUP_BATCH_SIZE = 500
+
+CANDIDATE_FIELDS = [
+    "s_no", "name", "center", "photo", "fathers_name", "dob", "rank", "trade", "adhaar_no",
+    "primary_qualification", "primary_duration", "primary_credits",
+    "secondary_qualification", "secondary_duration", "secondary_credits",
+    "nsqf_level", "training_center", "district", "state",
+    "viva_1", "viva_2", "practical_1", "practical_2",
+]
+
+
+def _text(val):
+    return "" if val is None else str(val).strip()
+
+
+def _candidate_defaults(row):
+    return {
+        "s_no": row.get("s_no") or 0,
+        "name": _text(row.get("name")),
+        "center": _text(row.get("center")),  # ✅ normalize Center
+        "photo": row.get("photo") or None,
+        "fathers_name": _text(row.get("fathers_name")),
+        "dob": row.get("dob") or None,
+        "rank": _text(row.get("rank")),
+        "trade": _text(row.get("trade")).upper(),    # ✅ normalize Trade
+        "adhaar_no": _text(row.get("adhaar_no")),
+        "primary_qualification": _text(row.get("primary_qualification")),
+        "primary_duration": row.get("primary_duration") or 0,
+        "primary_credits": row.get("primary_credits") or 0,
+        "secondary_qualification": _text(row.get("secondary_qualification")),
+        "secondary_duration": row.get("secondary_duration") or 0,
+        "secondary_credits": row.get("secondary_credits") or 0,
+        "nsqf_level": row.get("nsqf_level") or 0,
+        "training_center": _text(row.get("training_center")),
+        "district": _text(row.get("district")),
+        "state": _text(row.get("state")),
+        "viva_1": row.get("viva_1") or 0,
+        "viva_2": row.get("viva_2") or 0,
+        "practical_1": row.get("practical_1") or 0,
+        "practical_2": row.get("practical_2") or 0,
+    }
+
+
+def _question_values(row):
+    part = row.get("part") or None
+    if part:
+        part = str(part).strip().upper()
+    correct = row.get("correct_answer") or ""
+    if isinstance(correct, str) and correct.strip().lower() == "null":
+        correct = None
+    return {"part": part, "correct_answer": correct, "max_marks": row.get("max_marks") or 0}
+
+
+def _marks_obt(row):
+    # Also run by validate_rows (see _unwritable), so what validates can be written.
+    return int(row.get("marks_obt") or 0)
+
+
+def _to_python(model, values):
+    """Coerce raw cell values the way the model fields would, so diffs compare like with like."""
+    return {k: model._meta.get_field(k).to_python(v) for k, v in values.items()}
+
+
+def _row_hash(row):
+    """Content hash of a parsed row; xlsx and CSV copies of the same data hash alike."""
+    payload = repr(sorted((k, v) for k, v in row.items() if v is not None))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def file_fingerprint(file):
+    """sha256 of a path or seekable file object, read in blocks; the position is restored."""
+    digest = hashlib.sha256()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    file.seek(0)
+    for block in iter(lambda: file.read(1 << 20), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def new_import_stats():
+    return {
+        "rows": 0,
+        "created_candidates": 0, "updated_candidates": 0,
+        "created_questions": 0, "updated_questions": 0,
+        "created_answers": 0, "updated_answers": 0,
+        "skipped_rows": 0, "auto_marked": 0, "response_marked": 0, "unchanged_file": False,
+    }
+
+
+def format_import_summary(stats):
+    if stats.get("unchanged_file"):
+        return "File is identical to the last import; nothing to do."
+    summary = (
+        f"Candidates: +{stats['created_candidates']} / updated {stats['updated_candidates']}. "
+        f"Questions: +{stats['created_questions']}. "
+        f"Answers: +{stats['created_answers']} / updated {stats['updated_answers']}. "
+        f"Unchanged rows skipped: {stats.get('skipped_rows', 0)}."
+    )
+    if stats.get("auto_marked"):
+        summary += f" Auto-marked answers: {stats['auto_marked']}."
+    if stats.get("response_marked"):
+        summary += f" Marked from earlier response decisions: {stats['response_marked']}."
+    return summary
+
+
+def import_file(file, name=None, all_sheets=False, progress=None, force=False, auto_mark=False):
+    """
+    Import a whole upload, skipping it outright if it is identical to the most
+    recent import.
+
+    Only the most recent import can be skipped: an older file re-uploaded
+    after later imports (rolling back to an earlier sheet) must be re-applied.
+    Within any file, rows whose content hash matches the answer they were
+    last imported into are skipped too (see _import_chunk), so re-reading an
+    unchanged file stays cheap. ``force`` re-reads the latest file anyway. ``auto_mark`` runs the objective auto-marking
+    over the imported candidates afterwards.
+    """
+    fingerprint = file_fingerprint(file)
+    if not force and latest_import_fingerprint() == fingerprint:
+        stats = new_import_stats()
+        stats["unchanged_file"] = True
+        return stats
+
+    # Read the file twice: a cheap validation pass first, so a bad cell is
+    # reported before anything is written, then the import itself.
+    check_rows(read_rows(file, name, all_sheets=all_sheets))
+    if not isinstance(file, (str, os.PathLike)):
+        file.seek(0)
+    stats = import_rows(read_rows(file, name, all_sheets=all_sheets), progress=progress, auto_mark=auto_mark)
+    record_imported_file(fingerprint, name or getattr(file, "name", None) or str(file), stats)
+    return stats
+
+
+def latest_import_fingerprint():
+    """Fingerprint of the file imported last; nothing has been imported over it since."""
+    return ImportedFile.objects.order_by("-imported_at", "-pk").values_list("fingerprint", flat=True).first()
+
+
+def record_imported_file(fingerprint, name, stats):
+    ImportedFile.objects.update_or_create(
+        fingerprint=fingerprint,
+        defaults={"name": os.path.basename(str(name))[:255], "rows": stats["rows"]},
+    )
+
+
+def import_rows(rows, progress=None, auto_mark=False):
+    """
+    Upsert parsed sheet rows (one answer per row) into Candidate/Question/Answer.
+
+    Rows are consumed in chunks of IMPORT_CHUNK_ROWS: existing objects for the
+    chunk are loaded in a handful of IN queries, diffed in memory and written
+    with bulk_create/bulk_update. ``progress`` is called with the running stats
+    after every chunk. With ``auto_mark`` every candidate touched by the import
+    is auto-marked once the rows are in. Returns the stats dict.
+    """
+    stats = new_import_stats()
+    state = {"created_armies": set(), "updated_armies": set(), "candidate_ids": set()}
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, IMPORT_CHUNK_ROWS))
+        if not chunk:
+            break
+        with transaction.atomic():
+            _import_chunk(chunk, stats, state)
+        stats["rows"] += len(chunk)
+        if progress:
+            progress(stats)
+    if auto_mark:
+        stats["auto_marked"] = auto_mark_candidates(state["candidate_ids"])
+        if progress:
+            progress(stats)
+    return stats
+
+
+def _import_chunk(chunk, stats, state):
+    keyed = []
+    for row in chunk:
+        army = _text(row.get("army_no"))
+        if not army:
+            continue
+        text = row.get("question") or ""
+        q_key = (_text(row.get("exam_type")).lower(), question_hash(text))
+        keyed.append((army, q_key, text, row))
+
+    # ----- Delta: drop rows identical to what was last imported -----
+    known = _load_row_hashes({army for army, _, _, _ in keyed})
+
+    # ----- Parse: last row wins, blank values never overwrite -----
+    cand_rows = {}
+    question_rows = {}
+    question_texts = {}
+    answer_rows = {}
+    for army, q_key, text, row in keyed:
+        row_hash = _row_hash(row)
+        if known.get((army, q_key)) == row_hash:
+            stats["skipped_rows"] += 1
+            continue
+
+        defaults = _candidate_defaults(row)
+        if army in cand_rows:
+            cand_rows[army].update({k: v for k, v in defaults.items() if v})
+        else:
+            cand_rows[army] = defaults
+
+        question_texts.setdefault(q_key, text)
+        question_rows[q_key] = _question_values(row)
+
+        marks = _marks_obt(row)
+        answer = _text(row.get("answer"))
+        answer_rows[(army, q_key)] = {
+            "answer": answer, "marks_obt": marks, "import_hash": row_hash, "response_hash": response_hash(answer),
+        }
+
+    if not cand_rows:
+        return
+
+    candidates = _upsert_candidates(cand_rows, stats, state)
+    questions = _upsert_questions(question_rows, question_texts, stats)
+    _upsert_answers(answer_rows, candidates, questions, stats)
+    cand_ids = [c.pk for c in candidates.values()]
+    # Responses a grader has already marked (see grading.save_response_marks).
+    stats["response_marked"] += apply_response_marks(cand_ids)
+    # Bulk writes skip the model signals, so refresh the stored scores, merit
+    # lists, item statistics and cached exports here.
+    state["candidate_ids"].update(cand_ids)
+    refresh_scores(cand_ids)
+    mark_ranks_stale(cand_ids)
+    mark_item_stats_stale(q.pk for q in questions.values())
+    ResultsVersion.bump()
+
+
+def _load_row_hashes(armies):
+    known = {}
+    for batch in _chunks(armies, LOOKUP_BATCH_SIZE):
+        hashes = (
+            Answer.objects.filter(candidate__army_no__in=batch).exclude(import_hash="")
+            .values_list("candidate__army_no", "question__exam_type", "question__question_hash", "import_hash")
+        )
+        for army, exam_type, q_hash, row_hash in hashes:
+            known[(army, (exam_type, q_hash))] = row_hash
+    return known
+
+
+def _upsert_candidates(cand_rows, stats, state):
+    existing = {}
+    for batch in _chunks(cand_rows, LOOKUP_BATCH_SIZE):
+        for cand in Candidate.objects.filter(army_no__in=batch):
+            existing[cand.army_no] = cand
+
+    to_create, to_update = [], []
+    for army, values in cand_rows.items():
+        values = _to_python(Candidate, values)
+        cand = existing.get(army)
+        if cand is None:
+            to_create.append(Candidate(army_no=army, **values))
+            continue
+        changed = False
+        for k, v in values.items():
+            if v and getattr(cand, k) != v:
+                setattr(cand, k, v)
+                changed = True
+        if changed:
+            to_update.append(cand)
+
+    if to_create:
+        Candidate.objects.bulk_create(to_create, batch_size=IMPORT_BATCH_SIZE)
+        if any(c.pk is None for c in to_create):
+            for batch in _chunks([c.army_no for c in to_create], LOOKUP_BATCH_SIZE):
+                for cand in Candidate.objects.filter(army_no__in=batch):
+                    existing[cand.army_no] = cand
+        else:
+            existing.update({c.army_no: c for c in to_create})
+        new_armies = {c.army_no for c in to_create}
+        state["created_armies"] |= new_armies
+        stats["created_candidates"] += len(new_armies)
+    if to_update:
+        Candidate.objects.bulk_update(to_update, CANDIDATE_FIELDS, batch_size=IMPORT_BATCH_SIZE)
+        # A candidate whose rows span several chunks is still counted once.
+        fresh = {c.army_no for c in to_update} - state["created_armies"] - state["updated_armies"]
+        state["updated_armies"] |= fresh
+        stats["updated_candidates"] += len(fresh)
+    return existing
+
+
+def _upsert_questions(question_rows, question_texts, stats):
+    existing = _load_questions(question_rows)
+
+    to_create, to_update = [], []
+    for key, values in question_rows.items():
+        values = _to_python(Question, values)
+        q = existing.get(key)
+        if q is None:
+            # bulk_create skips save(), so the hash and answer key are set here explicitly.
+            q = Question(exam_type=key[0], question=question_texts[key], question_hash=key[1], **values)
+            q.sync_answer_key()
+            to_create.append(q)
+            continue
+        part = values["part"] or q.part
+        if (q.correct_answer, q.max_marks, q.part) != (values["correct_answer"], values["max_marks"], part):
+            q.correct_answer = values["correct_answer"]
+            q.max_marks = values["max_marks"]
+            q.part = part
+            q.sync_answer_key()
+            to_update.append(q)
+
+    if to_create:
+        Question.objects.bulk_create(to_create, batch_size=IMPORT_BATCH_SIZE)
+        if any(q.pk is None for q in to_create):
+            existing.update(_load_questions([(q.exam_type, q.question_hash) for q in to_create]))
+        else:
+            existing.update({(q.exam_type, q.question_hash): q for q in to_create})
+        stats["created_questions"] += len(to_create)
+    if to_update:
+        Question.objects.bulk_update(
+            to_update, ["correct_answer", "max_marks", "part", "answer_key", "answer_key_version"],
+            batch_size=IMPORT_BATCH_SIZE,
+        )
+        stats["updated_questions"] += len(to_update)
+    return existing
+
+
+def _load_questions(keys):
+    # Filtering on both columns keeps the lookup on the (exam_type, question_hash) unique index.
+    by_exam_type = {}
+    for exam_type, digest in keys:
+        by_exam_type.setdefault(exam_type, []).append(digest)
+
+    found = {}
+    for exam_type, hashes in by_exam_type.items():
+        for batch in _chunks(hashes, LOOKUP_BATCH_SIZE):
+            for q in Question.objects.filter(exam_type=exam_type, question_hash__in=batch):
+                found[(q.exam_type, q.question_hash)] = q
+    return found
+
+
+def _upsert_answers(answer_rows, candidates, questions, stats):
+    cand_ids = {candidates[army].pk for army, _ in answer_rows}
+    existing = {}
+    for batch in _chunks(cand_ids, LOOKUP_BATCH_SIZE):
+        for ans in Answer.objects.filter(candidate_id__in=batch):
+            existing[(ans.candidate_id, ans.question_id)] = ans
+
+    to_create, to_update = [], []
+    for (army, q_key), values in answer_rows.items():
+        cand_id, q_id = candidates[army].pk, questions[q_key].pk
+        ans = existing.get((cand_id, q_id))
+        if ans is None:
+            to_create.append(Answer(candidate_id=cand_id, question_id=q_id, **values))
+        elif ans.answer != values["answer"] or ans.marks_obt != values["marks_obt"]:
+            ans.answer = values["answer"]
+            ans.marks_obt = values["marks_obt"]
+            ans.import_hash = values["import_hash"]
+            ans.response_hash = values["response_hash"]
+            # The sheet's marks, not an auto-mark: auto_mark_candidates re-checks it.
+            ans.key_version = None
+            to_update.append(ans)
+            stats["updated_answers"] += 1
+        elif ans.import_hash != values["import_hash"]:
+            # Same answer, but some other column of the row changed.
+            ans.import_hash = values["import_hash"]
+            to_update.append(ans)
+
+    if to_create:
+        Answer.objects.bulk_create(to_create, batch_size=IMPORT_BATCH_SIZE)
+        stats["created_answers"] += len(to_create)
+    if to_update:
+        Answer.objects.bulk_update(
+            to_update, ["answer", "marks_obt", "import_hash", "response_hash", "key_version"],
+            batch_size=IMPORT_BATCH_SIZE,
+        )
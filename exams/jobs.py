@@ -0,0 +1,155 @@
+from __future__ import annotations
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.core.files import File
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .exports import prune_stale_exports, write_results_workbook
+from .grading import preload_grading_answers
+from .importing import import_file, format_import_summary
+from .models import ExportArtifact, ImportJob
+
+logger = logging.getLogger(__name__)
+
+# One worker keeps imports serialized, so queued center files never fight
+# over the SQLite write lock; the web request returns as soon as it is queued.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="exams-import")
+# Exports only read, so they get their own small pool instead of queueing
+# behind imports.
+_export_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="exams-export")
+# Warms the next grading-queue candidate while the grader works on the current one.
+_preload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="exams-preload")
+
+# A running import that has not reported progress for this long lost its
+# worker (e.g. to a restart).
+IMPORT_JOB_TIMEOUT = timedelta(minutes=15)
+
+
+def enqueue_import(job):
+    # Wait for the job row (and its stored file) to be committed before the
+    # worker thread, on its own connection, goes looking for it.
+    transaction.on_commit(lambda: _executor.submit(run_import_job, job.pk))
+
+
+def _finish_job(job, **fields):
+    # The upload is only needed while the job runs; its stats keep the outcome.
+    job.file.delete(save=False)
+    ImportJob.objects.filter(pk=job.pk).update(file="", finished_at=timezone.now(), **fields)
+
+
+def run_import_job(job_id):
+    close_old_connections()
+    try:
+        job = ImportJob.objects.get(pk=job_id)
+        now = timezone.now()
+        if not ImportJob.objects.filter(pk=job_id, status="queued").update(
+            status="running", started_at=now, heartbeat_at=now,
+        ):
+            # Already failed by fail_orphaned_jobs while it waited.
+            return
+
+        def progress(stats):
+            ImportJob.objects.filter(pk=job_id).update(
+                rows_processed=stats["rows"], stats=stats, heartbeat_at=timezone.now(),
+            )
+
+        try:
+            with job.file.open("rb") as fh:
+                stats = import_file(
+                    fh, job.original_name or job.file.name, progress=progress,
+                    auto_mark=job.auto_mark, force=job.force,
+                )
+        except Exception as e:
+            logger.exception("Import job %s failed", job_id)
+            _finish_job(job, status="failed", error=str(e))
+            return
+
+        _finish_job(job, status="done", rows_processed=stats["rows"], stats=stats)
+    finally:
+        connection.close()
+
+
+def fail_orphaned_jobs():
+    """
+    Fail jobs a restart left queued or running, so they can be submitted
+    again. A running job is orphaned once its heartbeat is older than
+    IMPORT_JOB_TIMEOUT; a queued one only when nothing is running, since it
+    may simply be waiting behind the job ahead of it.
+    """
+    cutoff = timezone.now() - IMPORT_JOB_TIMEOUT
+    orphaned = Q(status="running") & (Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True))
+    if not ImportJob.objects.filter(status="running", heartbeat_at__gte=cutoff).exists():
+        orphaned |= Q(status="queued", created_at__lt=cutoff)
+    for job in ImportJob.objects.filter(orphaned).only("file"):
+        _finish_job(job, status="failed", error="The import was interrupted (e.g. by a restart); upload the file again.")
+
+
+def job_status(job):
+    """Lightweight payload for the import page's progress polling."""
+    if job.status == "done":
+        summary = f"Import complete. {format_import_summary(job.stats)}"
+    elif job.status == "failed":
+        summary = f"Import failed: {job.error}"
+    else:
+        summary = ""
+    return {
+        "id": job.pk,
+        "name": job.original_name,
+        "status": job.status,
+        "rows_processed": job.rows_processed,
+        "summary": summary,
+    }
+
+
+def enqueue_export(artifact, queryset):
+    transaction.on_commit(lambda: _export_executor.submit(run_export_job, artifact.pk, queryset))
+
+
+def run_export_job(artifact_id, queryset):
+    close_old_connections()
+    try:
+        artifact = ExportArtifact.objects.get(pk=artifact_id)
+        try:
+            with tempfile.TemporaryFile() as output:
+                write_results_workbook(queryset, output)
+                output.seek(0)
+                artifact.file.save(f"results_{artifact.key[:16]}.xlsx", File(output), save=False)
+        except Exception as e:
+            logger.exception("Export %s failed", artifact_id)
+            ExportArtifact.objects.filter(pk=artifact_id).update(
+                status="failed", error=str(e), finished_at=timezone.now(),
+            )
+            return
+
+        ExportArtifact.objects.filter(pk=artifact_id).update(
+            status="ready", file=artifact.file.name, finished_at=timezone.now(),
+        )
+        prune_stale_exports(keep=artifact_id)
+    finally:
+        connection.close()
+
+
+def export_status(artifact):
+    return {
+        "id": artifact.pk,
+        "status": artifact.status,
+        "error": artifact.error or "",
+    }
+
+
+def enqueue_preload(candidate_id):
+    _preload_executor.submit(run_preload, candidate_id)
+
+
+def run_preload(candidate_id):
+    close_old_connections()
+    try:
+        preload_grading_answers(candidate_id)
+    except Exception:
+        # Only a warm-up: the grading page loads the answers itself if this fails.
+        logger.exception("Preloading candidate %s failed", candidate_id)
+    finally:
+        connection.close()
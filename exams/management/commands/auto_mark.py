@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from exams.grading import auto_mark_candidates, stale_auto_marks
+from exams.models import Candidate
+
+
+class Command(BaseCommand):
+    help = (
+        "Give full marks to unmarked objective answers that match the correct answer, "
+        "for all candidates or those selected by the filters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--center", help="Only candidates of this centre.")
+        parser.add_argument("--trade", help="Only candidates of this trade.")
+        parser.add_argument("--army-no", nargs="+", help="Only these army numbers.")
+
+    def handle(self, *args, **opts):
+        candidates = Candidate.objects.all()
+        if opts["center"]:
+            candidates = candidates.filter(center=opts["center"])
+        if opts["trade"]:
+            candidates = candidates.filter(trade=opts["trade"])
+        if opts["army_no"]:
+            candidates = candidates.filter(army_no__in=opts["army_no"])
+
+        ids = list(candidates.values_list("pk", flat=True))
+        stale = stale_auto_marks().filter(candidate__in=candidates).count()
+        if stale:
+            self.stdout.write(f"{stale} auto-mark(s) were made from an answer key edited since; re-checking them.")
+        started = time.perf_counter()
+        marked = auto_mark_candidates(ids)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Auto-marked {marked} answer(s) across {len(ids)} candidate(s) in {elapsed:.1f}s.")
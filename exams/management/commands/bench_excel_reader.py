@@ -0,0 +1,88 @@
+import csv
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from openpyxl import Workbook, load_workbook
+
+
+HEADERS = [
+    "S No", "Name", "Centre", "Father Name", "DOB", "Tde", "Rank", "Army No",
+    "Exam Type", "Question", "Answer", "Correct Answer", "Max Marks", "Part",
+]
+
+
+def _sample_rows(rows):
+    for i in range(rows):
+        yield [
+            i + 1, f"Candidate {i // 60}", "SWC-Jaipur", "Father", None, "TTC", "Sep",
+            f"A{i // 60:07d}", "primary", f"Question {i % 60}", "a", "a,b", 2, "A",
+        ]
+
+
+def _write_sample(path, rows):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append(HEADERS)
+    for row in _sample_rows(rows):
+        ws.append(row)
+    wb.save(path)
+
+
+def _write_sample_csv(path, rows):
+    with open(path, "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(HEADERS)
+        writer.writerows(_sample_rows(rows))
+
+
+def _legacy_reader(path):
+    # The pre-streaming reader: full workbook mode, every cell kept as an object.
+    wb = load_workbook(path, data_only=True)
+    ws = wb.worksheets[0]
+    for row in ws.iter_rows(min_row=2, values_only=True):
+        yield row
+
+
+def _measure(mode, path):
+    import django
+    django.setup()
+    from exams.importing import _read_rows_from_excel, _read_rows_from_csv
+
+    readers = {"streaming": _read_rows_from_excel, "legacy": _legacy_reader, "csv": _read_rows_from_csv}
+    reader = readers[mode]
+    started = time.perf_counter()
+    count = sum(1 for _ in reader(path))
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is reported in KiB on Linux.
+    return count, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = "Measure peak RSS and time of the import readers against row count."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", nargs="+", type=int, default=[10_000, 50_000, 100_000, 200_000])
+        parser.add_argument("--legacy", action="store_true", help="Also measure the old full-mode reader.")
+        parser.add_argument("--csv", action="store_true", help="Also measure the CSV reader on the same data.")
+
+    def handle(self, *args, **opts):
+        modes = ["streaming"] + (["legacy"] if opts["legacy"] else []) + (["csv"] if opts["csv"] else [])
+        # Each measurement runs in a fresh interpreter so peak RSS is not inherited.
+        ctx = multiprocessing.get_context("spawn")
+
+        self.stdout.write(f"{'rows':>10} {'mode':>10} {'seconds':>9} {'peak RSS MB':>12}")
+        with tempfile.TemporaryDirectory() as tmp:
+            for rows in opts["rows"]:
+                path = os.path.join(tmp, f"sample_{rows}.xlsx")
+                _write_sample(path, rows)
+                if opts["csv"]:
+                    _write_sample_csv(os.path.join(tmp, f"sample_{rows}.csv"), rows)
+                for mode in modes:
+                    source = os.path.join(tmp, f"sample_{rows}.csv") if mode == "csv" else path
+                    with ctx.Pool(1) as pool:
+                        count, elapsed, peak = pool.apply(_measure, (mode, source))
+                    self.stdout.write(f"{count:>10} {mode:>10} {elapsed:>9.2f} {peak:>12.1f}")
@@ -0,0 +1,133 @@
+import glob
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from exams.importing import (
+    IMPORT_EXTENSIONS, read_rows, import_rows, format_import_summary, new_import_stats,
+    file_fingerprint, latest_import_fingerprint, record_imported_file, validate_rows, ImportValidationError,
+)
+
+
+def _parse_workbook(path):
+    # Runs in a worker process: parsing and validation only, no database access.
+    started = time.perf_counter()
+    rows = list(read_rows(path, all_sheets=True))
+    errors, total = validate_rows(rows)
+    if total:
+        raise ImportValidationError(errors, total)
+    return rows, time.perf_counter() - started
+
+
+def _collect_paths(targets, pattern):
+    patterns = [pattern] if pattern else [f"*{ext}" for ext in IMPORT_EXTENSIONS]
+    paths = []
+    for target in targets:
+        if os.path.isdir(target):
+            for pat in patterns:
+                paths.extend(glob.glob(os.path.join(target, pat)))
+        elif glob.has_magic(target):
+            paths.extend(glob.glob(target))
+        elif os.path.isfile(target):
+            paths.append(target)
+        else:
+            raise CommandError(f"No such file or directory: {target}")
+    # Skip Excel's "~$" lock files and keep the order stable.
+    return sorted({p for p in paths if not os.path.basename(p).startswith("~$")})
+
+
+class Command(BaseCommand):
+    help = (
+        "Import answer workbooks (.xlsx/.csv/.tsv) from files, directories or glob patterns. "
+        "Every worksheet is read; parsing runs in a process pool and a single "
+        "writer loads the rows in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("targets", nargs="+", help="Workbook files, directories or glob patterns.")
+        parser.add_argument("--pattern", help="File pattern used inside directories (default: all .xlsx/.csv/.tsv).")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Number of parser processes.")
+        parser.add_argument("--force", action="store_true",
+                            help="Re-import a file even if it is identical to the last import.")
+        parser.add_argument("--auto-mark", action="store_true",
+                            help="Auto-mark objective answers of the imported candidates.")
+
+    def handle(self, *args, **opts):
+        paths = _collect_paths(opts["targets"], opts["pattern"])
+        if not paths:
+            raise CommandError("No workbooks found.")
+
+        fingerprints = {path: file_fingerprint(path) for path in paths}
+        if not opts["force"]:
+            # Only a copy of the most recent import is skipped; older files are
+            # re-applied (their unchanged rows are still skipped row by row).
+            latest = latest_import_fingerprint()
+            for path in [p for p in paths if fingerprints[p] == latest]:
+                self.stdout.write(f"{os.path.basename(path)}: same as the last import, skipped")
+                paths.remove(path)
+            if not paths:
+                return
+        workers = max(1, min(opts["workers"], len(paths)))
+        self.stdout.write(f"Importing {len(paths)} workbook(s) with {workers} parser process(es)")
+
+        totals = new_import_stats()
+        failed = []
+        started = time.perf_counter()
+
+        # Worker processes must not inherit open database connections.
+        connections.close_all()
+        pending = iter(paths)
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            # Keep a bounded number of parsed files in flight so memory stays
+            # proportional to the pool size, not the number of files.
+            in_flight = {}
+            for path in pending:
+                in_flight[pool.submit(_parse_workbook, path)] = path
+                if len(in_flight) >= workers * 2:
+                    break
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = in_flight.pop(future)
+                    next_path = next(pending, None)
+                    if next_path:
+                        in_flight[pool.submit(_parse_workbook, next_path)] = next_path
+                    self._write(path, future, fingerprints[path], totals, failed, opts["auto_mark"])
+
+        elapsed = time.perf_counter() - started
+        rate = totals["rows"] / elapsed if elapsed else 0
+        self.stdout.write(
+            f"Total: {totals['rows']} rows from {len(paths) - len(failed)} file(s) "
+            f"in {elapsed:.1f}s ({rate:.0f} rows/s). {format_import_summary(totals)}"
+        )
+        if failed:
+            raise CommandError(f"{len(failed)} file(s) failed: {', '.join(failed)}")
+
+    def _write(self, path, future, fingerprint, totals, failed, auto_mark):
+        name = os.path.basename(path)
+        try:
+            rows, parse_seconds = future.result()
+            write_started = time.perf_counter()
+            stats = import_rows(rows, auto_mark=auto_mark)
+            record_imported_file(fingerprint, name, stats)
+            write_seconds = time.perf_counter() - write_started
+        except Exception as e:
+            failed.append(name)
+            self.stderr.write(f"{name}: failed: {e}")
+            return
+
+        for key, value in stats.items():
+            if key != "unchanged_file":
+                totals[key] += value
+        total_seconds = parse_seconds + write_seconds
+        rate = stats["rows"] / total_seconds if total_seconds else 0
+        self.stdout.write(
+            f"{name}: {stats['rows']} rows, parse {parse_seconds:.1f}s, write {write_seconds:.1f}s "
+            f"({rate:.0f} rows/s). {format_import_summary(stats)}"
+        )
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from exams.models import Candidate, ResultsVersion
+from exams.ranking import mark_ranks_stale
+from exams.scoring import SCORE_BATCH_SIZE, refresh_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stored score columns on Candidate from their answers, in batches, "
+        "and report how many candidates had drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=SCORE_BATCH_SIZE,
+                            help="Candidates per batch.")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only report drift, do not write the corrected values.")
+
+    def handle(self, *args, **opts):
+        batch_size = max(1, opts["batch_size"])
+        ids = list(Candidate.objects.order_by("pk").values_list("pk", flat=True))
+        started = time.perf_counter()
+
+        drifted = 0
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            found = refresh_scores(batch, dry_run=opts["dry_run"])
+            drifted += len(found)
+            if found:
+                self.stdout.write(f"Candidates {batch[0]}-{batch[-1]}: {len(found)} out of date")
+                if not opts["dry_run"]:
+                    mark_ranks_stale(found)
+
+        if drifted and not opts["dry_run"]:
+            ResultsVersion.bump()
+        elapsed = time.perf_counter() - started
+        action = "found" if opts["dry_run"] else "fixed"
+        self.stdout.write(
+            f"Checked {len(ids)} candidate(s) in {elapsed:.1f}s; {drifted} drifted ({action})."
+        )
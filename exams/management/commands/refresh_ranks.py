@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from exams.ranking import refresh_ranks
+
+
+class Command(BaseCommand):
+    help = "Re-rank the merit list partitions (center, trade) whose scores changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Re-rank every partition, not only the stale ones.")
+
+    def handle(self, *args, **opts):
+        started = time.perf_counter()
+        count = refresh_ranks(rebuild=opts["rebuild"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Re-ranked {count} partition(s) in {elapsed:.1f}s.")
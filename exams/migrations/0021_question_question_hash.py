@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0020_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='question_hash',
+            field=models.CharField(default='', editable=False, max_length=64),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,59 @@
+import hashlib
+
+from django.db import migrations
+
+
+def _hash(text):
+    normalized = " ".join(str(text or "").split()).casefold()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def populate_question_hash(apps, schema_editor):
+    """
+    Hash every question and fold whitespace/case duplicates into the oldest row.
+
+    Answers pointing at a duplicate are moved to the surviving question. When a
+    candidate already answered both copies, the answer with the higher marks is
+    kept; imports store unmarked answers as 0, so NULL and 0 both count as
+    ungraded.
+    """
+    Question = apps.get_model("exams", "Question")
+    Answer = apps.get_model("exams", "Answer")
+
+    survivors = {}
+    for q in Question.objects.order_by("pk"):
+        q.exam_type = (q.exam_type or "").strip().lower()
+        q.question_hash = _hash(q.question)
+        key = (q.exam_type, q.question_hash)
+        keep = survivors.get(key)
+        if keep is None:
+            survivors[key] = q
+            q.save(update_fields=["exam_type", "question_hash"])
+            continue
+
+        kept_answers = {a.candidate_id: a for a in Answer.objects.filter(question_id=keep.pk)}
+        for ans in Answer.objects.filter(question_id=q.pk):
+            other = kept_answers.get(ans.candidate_id)
+            if other is None:
+                ans.question_id = keep.pk
+                ans.save(update_fields=["question"])
+                kept_answers[ans.candidate_id] = ans
+            elif (ans.marks_obt or 0) > (other.marks_obt or 0):
+                other.delete()
+                ans.question_id = keep.pk
+                ans.save(update_fields=["question"])
+                kept_answers[ans.candidate_id] = ans
+            else:
+                ans.delete()
+        q.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0021_question_question_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_question_hash, migrations.RunPython.noop),
+    ]
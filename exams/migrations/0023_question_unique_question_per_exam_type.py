@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0022_populate_question_hash'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='question',
+            constraint=models.UniqueConstraint(fields=('exam_type', 'question_hash'), name='unique_question_per_exam_type'),
+        ),
+    ]
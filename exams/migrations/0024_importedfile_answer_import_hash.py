@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0023_question_unique_question_per_exam_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('imported_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='import_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
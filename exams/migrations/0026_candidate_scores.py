@@ -0,0 +1,68 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:36
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_scores(apps, schema_editor):
+    Candidate = apps.get_model("exams", "Candidate")
+    Answer = apps.get_model("exams", "Answer")
+    totals = {
+        row["candidate_id"]: row
+        for row in Answer.objects.values("candidate_id").annotate(
+            primary=Sum("marks_obt", filter=Q(question__exam_type__iexact="primary")),
+            secondary=Sum("marks_obt", filter=Q(question__exam_type__iexact="secondary")),
+            ungraded=Count("id", filter=Q(marks_obt__isnull=True) | Q(marks_obt=0)),
+        )
+    }
+    changed = []
+    for cand in Candidate.objects.all().iterator():
+        row = totals.get(cand.pk, {})
+        cand.primary_theory_score = row.get("primary") or 0
+        cand.secondary_theory_score = row.get("secondary") or 0
+        cand.ungraded_answers = row.get("ungraded") or 0
+        cand.total_score = (
+            cand.primary_theory_score + cand.secondary_theory_score
+            + (cand.viva_1 or 0) + (cand.viva_2 or 0) + (cand.practical_1 or 0) + (cand.practical_2 or 0)
+        )
+        changed.append(cand)
+    Candidate.objects.bulk_update(
+        changed,
+        ["primary_theory_score", "secondary_theory_score", "total_score", "ungraded_answers"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0025_exportartifact_resultsversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='candidate',
+            name='primary_theory_score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='candidate',
+            name='secondary_theory_score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='candidate',
+            name='total_score',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='candidate',
+            name='ungraded_answers',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddIndex(
+            model_name='candidate',
+            index=models.Index(fields=['center', 'trade', '-total_score'], name='cand_center_trade_score_idx'),
+        ),
+        migrations.RunPython(populate_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0026_candidate_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankPartition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('center', models.CharField(blank=True, default='', max_length=255)),
+                ('trade', models.CharField(blank=True, default='', max_length=50)),
+                ('is_stale', models.BooleanField(db_index=True, default=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('center', 'trade'), name='unique_rank_partition')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RankSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('center', models.CharField(blank=True, default='', max_length=255)),
+                ('trade', models.CharField(blank=True, default='', max_length=50)),
+                ('total_score', models.IntegerField(default=0)),
+                ('primary_percentage', models.FloatField(default=0)),
+                ('secondary_percentage', models.FloatField(default=0)),
+                ('total_rank', models.PositiveIntegerField()),
+                ('primary_rank', models.PositiveIntegerField()),
+                ('secondary_rank', models.PositiveIntegerField()),
+                ('refreshed_at', models.DateTimeField()),
+                ('candidate', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rank_snapshot', to='exams.candidate')),
+            ],
+            options={
+                'verbose_name': 'merit rank',
+                'indexes': [models.Index(fields=['center', 'trade', 'total_rank'], name='rank_center_trade_total_idx'), models.Index(fields=['center', 'trade', 'primary_rank'], name='rank_center_trade_primary_idx'), models.Index(fields=['center', 'trade', 'secondary_rank'], name='rank_center_trade_second_idx')],
+            },
+        ),
+    ]
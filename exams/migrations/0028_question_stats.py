@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0027_rank_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('responses', models.PositiveIntegerField(default=0)),
+                ('mean_score', models.FloatField(default=0)),
+                ('difficulty', models.FloatField(blank=True, null=True)),
+                ('discrimination', models.FloatField(blank=True, null=True)),
+                ('option_counts', models.JSONField(blank=True, default=dict)),
+                ('is_stale', models.BooleanField(db_index=True, default=True)),
+                ('computed_at', models.DateTimeField(blank=True, null=True)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='exams.question')),
+            ],
+            options={
+                'verbose_name_plural': 'question stats',
+            },
+        ),
+    ]
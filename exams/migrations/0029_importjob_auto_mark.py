@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0028_question_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='auto_mark',
+            field=models.BooleanField(default=False, help_text='Auto-mark objective answers after the import.'),
+        ),
+    ]
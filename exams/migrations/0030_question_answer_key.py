@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:45
+
+from django.db import migrations, models
+
+
+def _compile(correct_answer):
+    return sorted({part.strip().lower() for part in str(correct_answer or "").split(",")} - {""})
+
+
+def populate_answer_keys(apps, schema_editor):
+    Question = apps.get_model("exams", "Question")
+    changed = []
+    for q in Question.objects.all().iterator():
+        q.answer_key = _compile(q.correct_answer)
+        if q.answer_key:
+            q.answer_key_version = 1
+            changed.append(q)
+    Question.objects.bulk_update(changed, ["answer_key", "answer_key_version"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0029_importjob_auto_mark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='key_version',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='answer_key',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='answer_key_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_answer_keys, migrations.RunPython.noop),
+    ]
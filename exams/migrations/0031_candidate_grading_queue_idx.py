@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0030_question_answer_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='candidate',
+            index=models.Index(fields=['is_checked', 'center', 'trade', 'id'], name='cand_grading_queue_idx'),
+        ),
+    ]
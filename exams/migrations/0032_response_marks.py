@@ -0,0 +1,69 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:51
+
+import hashlib
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _response_hash(text):
+    normalized = " ".join(str(text or "").split()).casefold()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def populate_response_hashes(apps, schema_editor):
+    Answer = apps.get_model("exams", "Answer")
+    batch = []
+    for ans in Answer.objects.only("id", "answer").iterator(chunk_size=2000):
+        ans.response_hash = _response_hash(ans.answer)
+        batch.append(ans)
+        if len(batch) >= 2000:
+            Answer.objects.bulk_update(batch, ["response_hash"])
+            batch = []
+    Answer.objects.bulk_update(batch, ["response_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0031_candidate_grading_queue_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponseMark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answer_hash', models.CharField(max_length=32)),
+                ('answer_text', models.TextField(blank=True)),
+                ('marks', models.IntegerField()),
+                ('decided_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='response_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', 'response_hash'], name='answer_question_response_idx'),
+        ),
+        migrations.RunPython(populate_response_hashes, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='responsemark',
+            name='decided_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='responsemark',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='response_marks', to='exams.question'),
+        ),
+        migrations.AddConstraint(
+            model_name='responsemark',
+            constraint=models.UniqueConstraint(fields=('question', 'answer_hash'), name='unique_response_mark'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0033_candidate_claims'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='force',
+            field=models.BooleanField(default=False, help_text='Re-import even if an identical file was imported before.'),
+        ),
+    ]
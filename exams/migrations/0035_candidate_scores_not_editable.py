@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0034_importjob_force'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='candidate',
+            name='primary_theory_score',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='candidate',
+            name='secondary_theory_score',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='candidate',
+            name='total_score',
+            field=models.IntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='candidate',
+            name='ungraded_answers',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0035_candidate_scores_not_editable'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='force',
+            field=models.BooleanField(default=False, help_text='Re-import even if the file is identical to the last import.'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0036_importjob_force_help'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportartifact',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,35 @@
+import hashlib
+from django.conf import settings
 from django.db import models
 
 
+def normalize_question_text(text):
+    """Collapse whitespace and case so trivially different copies of a question match."""
+    return " ".join(str(text or "").split()).casefold()
+
+
+def question_hash(text):
+    return hashlib.sha256(normalize_question_text(text).encode("utf-8")).hexdigest()
+
+
+def normalize_answer(text):
+    return str(text or "").strip().lower()
+
+
+def normalize_response(text):
+    """Collapse whitespace and case of a written answer, so identical responses cluster."""
+    return " ".join(str(text or "").split()).casefold()
+
+
+def response_hash(text):
+    return hashlib.blake2b(normalize_response(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def compile_answer_key(correct_answer):
+    """Accepted answers of a question, normalized and sorted: "A, b" -> ["a", "b"]."""
+    return sorted({normalize_answer(part) for part in str(correct_answer or "").split(",")} - {""})
+
+
 class Trade(models.Model):
     name = models.CharField(max_length=100, unique=True)
 
@@ -93,9 +122,39 @@ class Candidate(models.Model):
     practical_1 = models.IntegerField(default=0)
     practical_2 = models.IntegerField(default=0)
 
+    # Stored copies of the answer totals, kept current by exams.scoring.refresh_scores
+    # so they can be sorted, filtered and indexed. total_score includes viva/practical.
+    # Not editable: a typed-in total would no longer match the answers.
+    primary_theory_score = models.IntegerField(default=0, editable=False)
+    secondary_theory_score = models.IntegerField(default=0, editable=False)
+    total_score = models.IntegerField(default=0, db_index=True, editable=False)
+    # Answers with no marks yet (NULL or 0, as on the grading page).
+    ungraded_answers = models.PositiveIntegerField(default=0, db_index=True, editable=False)
+    # Grader currently holding this candidate (see exams.grading.claim_candidate);
+    # the claim lapses at claim_expires_at unless the grading page renews it.
+    claimed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name="+", editable=False,
+    )
+    claim_expires_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["center", "trade", "-total_score"], name="cand_center_trade_score_idx"),
+            # Grading queue: next unchecked candidate for a centre/trade, in id order.
+            models.Index(fields=["is_checked", "center", "trade", "id"], name="cand_grading_queue_idx"),
+        ]
+
     def __str__(self):
         return f"{self.army_no} - {self.name or ''}"
 
+    def save(self, *args, **kwargs):
+        self.total_score = self.stored_total()
+        super().save(*args, **kwargs)
+
+    def stored_total(self):
+        return (self.primary_theory_score or 0) + (self.secondary_theory_score or 0) + self.viva_practical_total()
+
     # ✅ Totals (fixed, no nesting)
     def total_primary(self):
         return sum((a.marks_obt or 0) for a in self.answer_set.filter(question__exam_type__iexact="primary"))
@@ -146,18 +205,237 @@ class Question(models.Model):
     exam_type = models.CharField(max_length=20, choices=EXAM_TYPES, default="primary")
     part = models.CharField(max_length=2, choices=PART_CHOICES, blank=True, null=True)
     question = models.TextField()
+    # sha256 of normalize_question_text(question); lookups go through this, not the TextField.
+    question_hash = models.CharField(max_length=64, editable=False)
     correct_answer = models.CharField(max_length=255, blank=True, null=True)
     max_marks = models.IntegerField(default=0)
+    # compile_answer_key(correct_answer), so marking is a set lookup. The
+    # version goes up whenever the key changes; auto-marks record the version
+    # they were made with (Answer.key_version).
+    answer_key = models.JSONField(default=list, blank=True, editable=False)
+    answer_key_version = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["exam_type", "question_hash"], name="unique_question_per_exam_type"),
+        ]
 
     def __str__(self):
         return f"{self.exam_type} {self.part or ''}: {self.question[:40]}"
 
+    def save(self, *args, **kwargs):
+        self.exam_type = (self.exam_type or "").strip().lower()
+        self.question_hash = question_hash(self.question)
+        self.sync_answer_key()
+        super().save(*args, **kwargs)
+
+    def sync_answer_key(self):
+        """Recompile answer_key from correct_answer; returns True (and bumps the version) if it changed."""
+        key = compile_answer_key(self.correct_answer)
+        if key == self.answer_key:
+            return False
+        self.answer_key = key
+        self.answer_key_version += 1
+        return True
+
 
 class Answer(models.Model):
     candidate = models.ForeignKey(Candidate, on_delete=models.CASCADE)
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     answer = models.TextField(blank=True, null=True)
     marks_obt = models.IntegerField(null=True, blank=True)
+    # Content hash of the spreadsheet row this answer was last imported from;
+    # re-imports skip rows whose hash has not changed.
+    import_hash = models.CharField(max_length=32, blank=True, default="", editable=False)
+    # Question.answer_key_version these marks were auto-assigned from; NULL
+    # once a grader sets the marks. A mismatch means the key was edited since.
+    key_version = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # response_hash(answer): answers with the same hash for a question are
+    # graded once, as a cluster (see ResponseMark).
+    response_hash = models.CharField(max_length=32, blank=True, default="", editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["question", "response_hash"], name="answer_question_response_idx"),
+        ]
 
     def __str__(self):
         return f"{self.candidate.army_no} - {self.question.exam_type}"
+
+    def save(self, *args, **kwargs):
+        self.response_hash = response_hash(self.answer)
+        super().save(*args, **kwargs)
+
+
+class ResultsVersion(models.Model):
+    """
+    Single-row counter bumped whenever anything that feeds the results changes.
+
+    Cached exports are keyed by it, so a bump makes every stored export stale.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def current(cls):
+        row = cls.objects.filter(pk=1).values_list("version", flat=True).first()
+        return row or 0
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(version=models.F("version") + 1):
+            cls.objects.get_or_create(pk=1, defaults={"version": 1})
+
+
+class ExportArtifact(models.Model):
+    STATUS_CHOICES = [
+        ("building", "Building"),
+        ("ready", "Ready"),
+        ("failed", "Failed"),
+    ]
+
+    key = models.CharField(max_length=64, unique=True)
+    filter_hash = models.CharField(max_length=64, db_index=True)
+    description = models.CharField(max_length=255, blank=True)
+    data_version = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="building")
+    file = models.FileField(upload_to="exports/", blank=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.description or self.key[:12]} v{self.data_version} ({self.status})"
+
+
+class ImportedFile(models.Model):
+    """
+    Fingerprint of a file that imported cleanly. Re-uploading the most recent
+    one is skipped (see importing.import_file); older ones are re-applied.
+    """
+    fingerprint = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, blank=True)
+    rows = models.PositiveIntegerField(default=0)
+    imported_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.fingerprint[:12]})"
+
+
+class ImportJob(models.Model):
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    file = models.FileField(upload_to="imports/")
+    original_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued", db_index=True)
+    rows_processed = models.PositiveIntegerField(default=0)
+    stats = models.JSONField(default=dict, blank=True)
+    auto_mark = models.BooleanField(default=False, help_text="Auto-mark objective answers after the import.")
+    force = models.BooleanField(default=False, help_text="Re-import even if the file is identical to the last import.")
+    error = models.TextField(blank=True, null=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Bumped by the worker as it makes progress; see jobs.fail_orphaned_jobs.
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.original_name or self.file.name} ({self.status})"
+
+
+class RankPartition(models.Model):
+    """
+    One (center, trade) merit list. Score changes mark it stale; the next read
+    of the merit list re-ranks only the stale partitions.
+    """
+    center = models.CharField(max_length=255, blank=True, default="")
+    trade = models.CharField(max_length=50, blank=True, default="")
+    is_stale = models.BooleanField(default=True, db_index=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["center", "trade"], name="unique_rank_partition"),
+        ]
+
+    def __str__(self):
+        return f"{self.center or '-'} / {self.trade or '-'}"
+
+
+class RankSnapshot(models.Model):
+    """Dense ranks of one candidate within its center and trade, as of the last refresh."""
+    candidate = models.OneToOneField(Candidate, on_delete=models.CASCADE, related_name="rank_snapshot")
+    center = models.CharField(max_length=255, blank=True, default="")
+    trade = models.CharField(max_length=50, blank=True, default="")
+    total_score = models.IntegerField(default=0)
+    primary_percentage = models.FloatField(default=0)
+    secondary_percentage = models.FloatField(default=0)
+    total_rank = models.PositiveIntegerField()
+    primary_rank = models.PositiveIntegerField()
+    secondary_rank = models.PositiveIntegerField()
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "merit rank"
+        indexes = [
+            models.Index(fields=["center", "trade", "total_rank"], name="rank_center_trade_total_idx"),
+            models.Index(fields=["center", "trade", "primary_rank"], name="rank_center_trade_primary_idx"),
+            models.Index(fields=["center", "trade", "secondary_rank"], name="rank_center_trade_second_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.candidate_id} #{self.total_rank} ({self.center} / {self.trade})"
+
+
+class QuestionStats(models.Model):
+    """
+    Cached item analysis for one question. Answer changes mark it stale and
+    only stale rows are recomputed when the dashboard is opened.
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name="stats")
+    responses = models.PositiveIntegerField(default=0)
+    mean_score = models.FloatField(default=0)
+    # Mean score / max_marks: 1.0 means everyone got full marks.
+    difficulty = models.FloatField(null=True, blank=True)
+    # Mean score of the top group minus the bottom group, over max_marks.
+    discrimination = models.FloatField(null=True, blank=True)
+    # Normalized answer -> number of candidates who gave it (parts A-C and F only).
+    option_counts = models.JSONField(default=dict, blank=True)
+    is_stale = models.BooleanField(default=True, db_index=True)
+    computed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "question stats"
+
+    def __str__(self):
+        return f"Stats for question {self.question_id}"
+
+
+class ResponseMark(models.Model):
+    """
+    A grader's decision for one distinct response to a question. It is applied
+    to every matching answer, and to matching answers imported later.
+    """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name="response_marks")
+    answer_hash = models.CharField(max_length=32)
+    answer_text = models.TextField(blank=True)
+    marks = models.IntegerField()
+    decided_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    decided_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["question", "answer_hash"], name="unique_response_mark"),
+        ]
+
+    def __str__(self):
+        return f"{self.question_id}: {self.answer_text[:30]!r} = {self.marks}"
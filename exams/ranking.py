@@ -0,0 +1,115 @@
+from __future__ import annotations
+from django.db import transaction
+from django.db.models import F, Q, Value, Window
+from django.db.models.functions import Coalesce, DenseRank
+from django.utils import timezone
+from .models import Candidate, RankPartition, RankSnapshot
+from .scoring import with_stored_percentages
+
+# Partitions re-ranked per window query.
+RANK_PARTITION_BATCH = 50
+RANK_WRITE_BATCH = 1000
+
+
+def ranked_candidates(queryset, max_marks=None):
+    """
+    Annotate dense ``total_rank``, ``primary_rank`` and ``secondary_rank`` within
+    each (center, trade), using window functions over the stored score columns.
+    """
+    # NULL and "" are the same partition, as in RankPartition.
+    partition = [Coalesce("center", Value("")), Coalesce("trade", Value(""))]
+
+    def dense_rank(field):
+        return Window(DenseRank(), partition_by=partition, order_by=F(field).desc())
+
+    return with_stored_percentages(queryset, max_marks).annotate(
+        total_rank=dense_rank("total_score"),
+        primary_rank=dense_rank("primary_percentage"),
+        secondary_rank=dense_rank("secondary_percentage"),
+    )
+
+
+def mark_partitions_stale(partitions):
+    """Flag (center, trade) pairs for re-ranking; cheap enough to call on every score change."""
+    partitions = {(center or "", trade or "") for center, trade in partitions}
+    if not partitions:
+        return
+    existing = set()
+    lookup = Q()
+    for center, trade in partitions:
+        lookup |= Q(center=center, trade=trade)
+    for center, trade in RankPartition.objects.filter(lookup).values_list("center", "trade"):
+        existing.add((center, trade))
+    RankPartition.objects.filter(lookup, is_stale=False).update(is_stale=True)
+    RankPartition.objects.bulk_create(
+        [RankPartition(center=c, trade=t) for c, t in partitions - existing], ignore_conflicts=True,
+    )
+
+
+def mark_ranks_stale(candidate_ids):
+    """Mark the current and previously ranked partitions of these candidates stale."""
+    ids = list(candidate_ids)
+    if not ids:
+        return
+    partitions = set(Candidate.objects.filter(pk__in=ids).values_list("center", "trade"))
+    # A candidate who moved center or trade leaves a gap in the old list too.
+    partitions |= set(RankSnapshot.objects.filter(candidate_id__in=ids).values_list("center", "trade"))
+    mark_partitions_stale(partitions)
+
+
+def refresh_ranks(rebuild=False):
+    """
+    Re-rank the stale partitions (every partition with ``rebuild``) and return how many.
+
+    Each batch of partitions is ranked by one window query and its snapshot
+    rows replaced in one transaction. A partition marked stale again while
+    it is being ranked stays stale for the next refresh.
+    """
+    if rebuild:
+        mark_partitions_stale(Candidate.objects.values_list("center", "trade").distinct())
+    stale = list(RankPartition.objects.filter(is_stale=True).values_list("pk", "center", "trade"))
+    for start in range(0, len(stale), RANK_PARTITION_BATCH):
+        _refresh_batch(stale[start:start + RANK_PARTITION_BATCH])
+    return len(stale)
+
+
+def _refresh_batch(partitions):
+    now = timezone.now()
+    lookup = Q()
+    for _, center, trade in partitions:
+        lookup |= _candidates_in(center, trade)
+
+    with transaction.atomic():
+        RankPartition.objects.filter(pk__in=[pk for pk, _, _ in partitions]).update(
+            is_stale=False, refreshed_at=now,
+        )
+        ranked = ranked_candidates(Candidate.objects.filter(lookup)).values_list(
+            "pk", "center", "trade", "total_score", "primary_percentage", "secondary_percentage",
+            "total_rank", "primary_rank", "secondary_rank",
+        )
+        snapshots = [
+            RankSnapshot(
+                candidate_id=pk, center=center or "", trade=trade or "", total_score=total,
+                primary_percentage=primary_pct, secondary_percentage=secondary_pct,
+                total_rank=total_rank, primary_rank=primary_rank, secondary_rank=secondary_rank,
+                refreshed_at=now,
+            )
+            for pk, center, trade, total, primary_pct, secondary_pct, total_rank, primary_rank, secondary_rank
+            in ranked
+        ]
+        old = Q(candidate__in=Candidate.objects.filter(lookup))
+        for _, center, trade in partitions:
+            old |= Q(center=center, trade=trade)
+        RankSnapshot.objects.filter(old).delete()
+        RankSnapshot.objects.bulk_create(snapshots, batch_size=RANK_WRITE_BATCH)
+
+
+def _candidates_in(center, trade):
+    # Partitions store "" for a missing center/trade; candidates may hold NULL.
+    q = Q()
+    for field, value in (("center", center), ("trade", trade)):
+        if value:
+            q &= Q(**{field: value})
+        else:
+            q &= Q(**{field: ""}) | Q(**{f"{field}__isnull": True})
+    return q
@@ -0,0 +1,160 @@
+from __future__ import annotations
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Round
+from .models import Answer, Candidate, ExamConfig
+
+# exam type -> (theory annotation, viva field, practical field)
+EXAM_PARTS = {
+    "primary": ("primary_theory", "viva_1", "practical_1"),
+    "secondary": ("secondary_theory", "viva_2", "practical_2"),
+}
+
+# Stored on Candidate and maintained by refresh_scores().
+SCORE_FIELDS = ("primary_theory_score", "secondary_theory_score", "total_score", "ungraded_answers")
+SCORE_BATCH_SIZE = 500
+
+
+def with_theory_totals(queryset):
+    """
+    Annotate ``primary_theory`` and ``secondary_theory`` (sum of marks_obt per exam type).
+
+    One grouped query replaces the two answer_set queries per candidate that
+    total_primary()/total_secondary() issue.
+    """
+    return queryset.annotate(
+        primary_theory=Coalesce(
+            Sum("answer__marks_obt", filter=Q(answer__question__exam_type__iexact="primary")),
+            Value(0), output_field=IntegerField(),
+        ),
+        secondary_theory=Coalesce(
+            Sum("answer__marks_obt", filter=Q(answer__question__exam_type__iexact="secondary")),
+            Value(0), output_field=IntegerField(),
+        ),
+    )
+
+
+def _answer_totals(candidate_ids):
+    totals = (
+        Answer.objects.filter(candidate_id__in=candidate_ids)
+        .values("candidate_id")
+        .annotate(
+            primary=Coalesce(Sum("marks_obt", filter=Q(question__exam_type__iexact="primary")), 0),
+            secondary=Coalesce(Sum("marks_obt", filter=Q(question__exam_type__iexact="secondary")), 0),
+            # Same notion of "not marked" as the grading page: NULL or 0.
+            ungraded=Count("id", filter=Q(marks_obt__isnull=True) | Q(marks_obt=0)),
+        )
+    )
+    return {row["candidate_id"]: row for row in totals}
+
+
+def refresh_scores(candidate_ids, dry_run=False):
+    """
+    Recompute the stored score columns for ``candidate_ids`` from their answers.
+
+    One grouped query and one candidate query per batch; only candidates whose
+    stored values were out of date are written, with bulk_update. Returns the
+    ids of those candidates. With ``dry_run`` nothing is written.
+
+    Answer.save()/delete() trigger this through the signals; bulk paths that
+    skip save() (the importer, bulk grading) must call it themselves.
+    """
+    ids = sorted({pk for pk in candidate_ids if pk is not None})
+    drifted = []
+    for start in range(0, len(ids), SCORE_BATCH_SIZE):
+        batch = ids[start:start + SCORE_BATCH_SIZE]
+        totals = _answer_totals(batch)
+        changed = []
+        candidates = Candidate.objects.filter(pk__in=batch).only(
+            "viva_1", "viva_2", "practical_1", "practical_2", *SCORE_FIELDS,
+        )
+        for cand in candidates:
+            row = totals.get(cand.pk, {})
+            fresh = {
+                "primary_theory_score": row.get("primary", 0),
+                "secondary_theory_score": row.get("secondary", 0),
+                "ungraded_answers": row.get("ungraded", 0),
+            }
+            fresh["total_score"] = (
+                fresh["primary_theory_score"] + fresh["secondary_theory_score"] + cand.viva_practical_total()
+            )
+            if any(getattr(cand, field) != value for field, value in fresh.items()):
+                for field, value in fresh.items():
+                    setattr(cand, field, value)
+                changed.append(cand)
+        drifted.extend(cand.pk for cand in changed)
+        if changed and not dry_run:
+            Candidate.objects.bulk_update(changed, SCORE_FIELDS)
+    return drifted
+
+
+def exam_config_max_marks():
+    """
+    Map (trade name, exam type) to total max marks (theory + practical + viva), in one query.
+
+    Exam types are lower-cased to match Question.exam_type.
+    """
+    configs = ExamConfig.objects.values_list(
+        "trade__name", "exam_type", "max_theory_marks", "max_practical_marks", "max_viva_marks",
+    )
+    return {
+        (trade, exam_type.lower()): theory + practical + viva
+        for trade, exam_type, theory, practical, viva in configs
+    }
+
+
+def percentage_of(scored, max_marks):
+    if not max_marks:
+        return 0
+    return round((scored / max_marks) * 100, 2)
+
+
+def with_percentages(queryset, max_marks=None):
+    """
+    Annotate theory totals plus ``primary_percentage`` and ``secondary_percentage``.
+
+    The ExamConfig map is loaded once and inlined as a CASE on trade, so the
+    percentages come out of the same grouped query as the totals and can be
+    sorted on. Candidates without a config for their trade get 0, as
+    Candidate.percentage() does.
+    """
+    return with_theory_totals(queryset).annotate(**_percentage_annotations(max_marks))
+
+
+def with_stored_percentages(queryset, max_marks=None):
+    """
+    Like with_percentages(), but from the stored score columns instead of the answers.
+
+    No join or GROUP BY, so the percentages can feed window functions and indexes.
+    """
+    queryset = queryset.annotate(
+        primary_theory=F("primary_theory_score"), secondary_theory=F("secondary_theory_score"),
+    )
+    return queryset.annotate(**_percentage_annotations(max_marks))
+
+
+def _percentage_annotations(max_marks=None):
+    if max_marks is None:
+        max_marks = exam_config_max_marks()
+
+    annotations = {}
+    for exam_type, (theory, viva, practical) in EXAM_PARTS.items():
+        totals = {
+            trade: total for (trade, config_type), total in max_marks.items()
+            if config_type == exam_type and total
+        }
+        if not totals:
+            annotations[f"{exam_type}_percentage"] = Value(0.0, output_field=FloatField())
+            continue
+        max_expr = Case(
+            *[When(trade=trade, then=Value(total)) for trade, total in totals.items()],
+            output_field=IntegerField(),
+        )
+        scored = F(theory) + Coalesce(F(viva), 0) + Coalesce(F(practical), 0)
+        annotations[f"{exam_type}_percentage"] = Case(
+            When(trade__in=list(totals), then=Round(
+                ExpressionWrapper(scored * 100.0 / max_expr, output_field=FloatField()), 2,
+            )),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    return annotations
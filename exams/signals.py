@@ -0,0 +1,90 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .analysis import mark_item_stats_stale
+from .models import Answer, Candidate, ExamConfig, Question, RankPartition, ResultsVersion, Trade
+from .ranking import mark_partitions_stale, mark_ranks_stale
+from .scoring import refresh_scores
+
+
+def _cascaded(origin):
+    # True when an answer is deleted along with its candidate or question:
+    # the parent's receivers then refresh once, instead of once per answer.
+    if origin is None:
+        return False
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is not Answer
+
+
+# Anything shown in the results export makes cached exports stale. Bulk
+# paths (bulk_create/bulk_update/update) skip these signals and call
+# ResultsVersion.bump() themselves.
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+@receiver(post_save, sender=Candidate)
+@receiver(post_delete, sender=Candidate)
+@receiver(post_save, sender=ExamConfig)
+@receiver(post_delete, sender=ExamConfig)
+def bump_results_version(sender, origin=None, **kwargs):
+    if sender is Answer and _cascaded(origin):
+        return
+    ResultsVersion.bump()
+
+
+# Keep Candidate's stored score columns in step with single-answer edits.
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+def refresh_candidate_scores(sender, instance, origin=None, **kwargs):
+    if _cascaded(origin):
+        return
+    mark_ranks_stale(refresh_scores([instance.candidate_id]))
+    mark_item_stats_stale([instance.question_id])
+
+
+@receiver(pre_delete, sender=Candidate)
+def stale_deleted_candidate_stats(sender, instance, **kwargs):
+    # Its answers go with it (see _cascaded); their questions' stats change.
+    mark_item_stats_stale(
+        Answer.objects.filter(candidate=instance).values_list("question_id", flat=True).distinct()
+    )
+
+
+@receiver(pre_delete, sender=Question)
+def remember_question_candidates(sender, instance, **kwargs):
+    instance._answered_by = list(
+        Answer.objects.filter(question=instance).values_list("candidate_id", flat=True).distinct()
+    )
+
+
+@receiver(post_delete, sender=Question)
+def refresh_deleted_question_scores(sender, instance, **kwargs):
+    # One set-based refresh for every candidate who answered the question.
+    candidate_ids = getattr(instance, "_answered_by", [])
+    if candidate_ids:
+        mark_ranks_stale(refresh_scores(candidate_ids))
+        ResultsVersion.bump()
+
+
+@receiver(post_save, sender=Question)
+def stale_question_stats(sender, instance, **kwargs):
+    # max_marks or part may have changed.
+    mark_item_stats_stale([instance.pk])
+
+
+# Merit lists are re-ranked lazily; these only flag the affected partitions.
+@receiver(post_save, sender=Candidate)
+def stale_candidate_ranks(sender, instance, **kwargs):
+    mark_ranks_stale([instance.pk])
+
+
+@receiver(post_delete, sender=Candidate)
+def stale_deleted_candidate_ranks(sender, instance, **kwargs):
+    mark_partitions_stale([(instance.center, instance.trade)])
+
+
+@receiver(post_save, sender=ExamConfig)
+@receiver(post_delete, sender=ExamConfig)
+def stale_trade_ranks(sender, instance, **kwargs):
+    # Percentage ranks depend on the trade's max marks.
+    trade = Trade.objects.filter(pk=instance.trade_id).values("name")
+    RankPartition.objects.filter(trade__in=trade).update(is_stale=True)